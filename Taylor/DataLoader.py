@@ -3,6 +3,7 @@ from MapGen import MapGen
 import os
 import sys
 import ast
+import json
 from joblib import Parallel, delayed
 import time
 from MapUtils import MapUtils
@@ -47,9 +48,35 @@ def collect_game_states_worker(args):
 
     return data, labels
 
+def count_raw_Cs_range(args):
+    """Standalone worker function for counting the state rows of a byte range of a raw C# output CSV"""
+    path, start, end = args
+    return len(DataLoader.read_raw_Cs_range(path, start, end))
+
+def convert_raw_Cs_range(args):
+    """Standalone worker function for featurizing the state rows of a byte range of a raw C# output CSV into a columnar dataset"""
+    path, start, end, offset, indices, columns_path, max_units, fast, mask, batch_size = args
+    lines = DataLoader.read_raw_Cs_range(path, start, end)
+    columns, label_column = DataLoader.open_columns(columns_path, 'r+')
+    for first in range(0, len(lines), batch_size):
+        data, labels = DataLoader.featurize_raw_Cs_lines(lines[first:first+batch_size], indices, max_units, fast, mask)
+        position = offset + first
+        for name, column, array in zip(DataLoader.COLUMNS, columns, data):
+            if not np.array_equal(array.astype(column.dtype), array):
+                raise ValueError(f'column {name} of rows {position}.. does not fit {column.dtype}')
+            column[position:position+len(labels)] = array
+        label_column[position:position+len(labels)] = labels
+    DataLoader.flush_columns(columns, label_column)
+    return len(lines)
+
 
 class DataLoader:
 
+    # data columns, in the order of create_data_matrices, and the files of the columnar format
+    COLUMNS = ['Adjacency', 'Feature', 'Manhattan', 'Unobstructed', 'Damage', 'Map', 'Type', 'Team', 'HP', 'Moved']
+    LABEL_COLUMN = 'Label'
+    MANIFEST = 'manifest.json'
+
     def __init__(self, dir=None):
         self.active_dir = "./" if dir is None else dir
         
@@ -260,7 +287,8 @@ class DataLoader:
         # read csv file, delineator :
         raw_df = pd.read_csv(self.active_dir+fname, sep=':')
 
-        data = []
+        map_matrices = []
+        unit_lists = []
         labels = []
         for index, row in raw_df.iterrows():
             # get map_matrix from raw string in col 'map'
@@ -269,12 +297,27 @@ class DataLoader:
             unit_list = []
             for unit in unit_matrix:
                 unit_list.append(UnitData(unit[0], unit[1], unit[2], unit[3], unit[4], unit[5]))
-            result = row['result']
-
-            # map_matrix, unit_list, move = state
-            new_data = MapUtils.create_data_matrices(unit_list, map_matrix, max_units, fast, mask)
-            data.append(new_data)
-            labels.append(result)
+            map_matrices.append(map_matrix)
+            unit_lists.append(unit_list)
+            labels.append(row['result'])
+
+        if not fast:
+            data = [MapUtils.create_data_matrices(unit_list, map_matrix, max_units, fast, mask)
+                    for unit_list, map_matrix in zip(unit_lists, map_matrices)]
+            return data, labels
+
+        # featurize all rows with the same map size in one batch
+        states, counts = MapUtils.units_to_array(unit_lists, max_units)
+        rows_by_size = {}
+        for index, map_matrix in enumerate(map_matrices):
+            rows_by_size.setdefault((len(map_matrix), len(map_matrix[0])), []).append(index)
+        data = [None] * len(labels)
+        for rows in rows_by_size.values():
+            columns = MapUtils.create_data_matrices_batch(states[rows], counts[rows], [map_matrices[index] for index in rows], max_units, mask)
+            # back to nested lists of ints, as the rows are saved with save_data_cols
+            columns = [column.astype(np.int64).tolist() for column in columns]
+            for position, index in enumerate(rows):
+                data[index] = tuple(column[position] for column in columns)
         return data, labels
 
 
@@ -396,6 +439,275 @@ class DataLoader:
         tensors = [tf.convert_to_tensor(var) for var in loaded.tensors]
         return tensors[:-1], tensors[-1]
 
+    # columnar format: a directory with one .npy array per column (int8 features if they fit,
+    # else float32, float32 labels) and a manifest of the columns, their dtypes and shapes
+    def save_columns(self, data, labels, dirname):
+        """Save col style data, labels in the columnar format"""
+        arrays = [np.asarray(col) for col in data]
+        for name, array in zip(self.COLUMNS, arrays):
+            if array.dtype == object or len(array) != len(labels):
+                raise ValueError(f'column {name} is not a {len(labels)} x matrix array (maps of different sizes?)')
+        dtypes = [self.column_dtype(array) for array in arrays]
+        columns, label_column = self.create_columns(dirname, len(labels), [array.shape[1:] for array in arrays], dtypes)
+        for column, array in zip(columns, arrays):
+            column[:] = array
+        label_column[:] = labels
+        self.flush_columns(columns, label_column)
+        print(f'Saved {len(labels)} maps in {self.active_dir} and saved to {dirname}')
+
+    def create_columns(self, dirname, count, shapes, dtypes):
+        """Write the manifest of a columnar dataset and return writable memmaps of its columns and labels"""
+        path = self.active_dir+dirname
+        os.makedirs(path, exist_ok=True)
+        manifest = {'count': count, 'columns': [], 'label': {'file': self.LABEL_COLUMN+'.npy', 'dtype': 'float32'}}
+        columns = []
+        for name, shape, dtype in zip(self.COLUMNS, shapes, dtypes):
+            fname = name+'.npy'
+            columns.append(np.lib.format.open_memmap(os.path.join(path, fname), mode='w+', dtype=dtype, shape=(count,)+tuple(shape)))
+            manifest['columns'].append({'name': name, 'file': fname, 'dtype': np.dtype(dtype).name, 'shape': list(shape)})
+        label_column = np.lib.format.open_memmap(os.path.join(path, self.LABEL_COLUMN+'.npy'), mode='w+', dtype=np.float32, shape=(count,))
+        with open(os.path.join(path, self.MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=1)
+        return columns, label_column
+
+    @staticmethod
+    def flush_columns(columns, label_column):
+        for column in columns + [label_column]:
+            column.flush()
+
+    def load_columns(self, dirname, mmap_mode=None):
+        """
+        Load a columnar dataset as col style data (arrays) and labels; with mmap_mode ('r')
+        the arrays are memory-mapped instead of read
+        """
+        return self.open_columns(self.active_dir+dirname, mmap_mode)
+
+    @staticmethod
+    def open_columns(path, mmap_mode=None):
+        with open(os.path.join(path, DataLoader.MANIFEST)) as f:
+            manifest = json.load(f)
+        data = [np.load(os.path.join(path, column['file']), mmap_mode=mmap_mode) for column in manifest['columns']]
+        labels = np.load(os.path.join(path, manifest['label']['file']), mmap_mode=mmap_mode)
+        return data, labels
+
+    def columns_dataset(self, dirname, batch_size, columns=None, shuffle=True, seed=None):
+        """
+        tf.data.Dataset of (inputs, labels) batches of a columnar dataset, gathered batch by batch
+        from memory-mapped columns, so the dataset does not have to fit in memory. columns are
+        the indices of the input columns (all by default; model.select_data(list(range(10)))
+        gives a model's). With shuffle, the samples are shuffled by index every epoch.
+        """
+        data, labels = self.load_columns(dirname, mmap_mode='r')
+        if columns is None:
+            columns = range(len(data))
+        data = [data[i] for i in columns]
+
+        def read_batch(indices):
+            # sorted, the rows of a batch are read in file order
+            indices = np.sort(indices)
+            return tuple([column[indices].astype(np.float32) for column in data] + [labels[indices]])
+
+        def to_inputs(indices):
+            tensors = tf.numpy_function(read_batch, [indices], [tf.float32] * (len(data) + 1))
+            for tensor, column in zip(tensors, data):
+                tensor.set_shape((None,) + column.shape[1:])
+            tensors[-1].set_shape((None,))
+            return tuple(tensors[:-1]), tensors[-1]
+
+        dataset = tf.data.Dataset.range(len(labels))
+        if shuffle:
+            dataset = dataset.shuffle(len(labels), seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size).map(to_inputs, num_parallel_calls=tf.data.AUTOTUNE)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+    def raw_Cs_dataset(self, fname, batch_size, columns=None, max_units=6, fast=True, mask=False, shuffle_buffer=10000, cache=True):
+        """
+        tf.data.Dataset of (inputs, labels) batches of the game states of a raw C# output CSV
+        (see load_raw_Cs_output). Rows are streamed as text lines and featurized batch by batch
+        in parallel map stages (create_data_matrices_batch, or create_data_matrices per state
+        if not fast). The features are cached in memory after the first epoch if cache, then
+        shuffled and prefetched. columns are the indices of the input columns, as in
+        columns_dataset.
+        """
+        indices = self.raw_Cs_indices(fname)
+        if columns is None:
+            columns = range(len(self.COLUMNS))
+        columns = list(columns)
+
+        def featurize(lines):
+            data, labels = self.featurize_raw_Cs_lines([line.decode() for line in lines], indices, max_units, fast, mask)
+            return tuple([data[i].astype(np.float32) for i in columns] + [labels])
+
+        def to_inputs(lines):
+            tensors = tf.numpy_function(featurize, [lines], [tf.float32] * (len(columns) + 1))
+            for tensor in tensors[:-1]:
+                tensor.set_shape([None] * 3)
+            tensors[-1].set_shape((None,))
+            return tuple(tensors[:-1]), tensors[-1]
+
+        dataset = tf.data.TextLineDataset(self.active_dir+fname).skip(1)
+        dataset = dataset.batch(batch_size).map(to_inputs, num_parallel_calls=tf.data.AUTOTUNE)
+        if cache:
+            dataset = dataset.cache()
+        # shuffle states, not featurized batches
+        dataset = dataset.unbatch().shuffle(shuffle_buffer).batch(batch_size)
+        return dataset.prefetch(tf.data.AUTOTUNE)
+
+    def convert_raw_Cs_to_columns(self, fname, dirname, max_units=6, fast=True, mask=False, chunk_bytes=1 << 22, batch_size=4096):
+        """
+        Convert a raw C# output CSV (see load_raw_Cs_output) to the columnar format with int8
+        features. The file is split into byte ranges of chunk_bytes that a pool of n_workers
+        processes count, then parse and featurize batch_size rows at a time, writing them
+        straight into the memory-mapped columns, so memory use does not grow with the file.
+        """
+        path = os.path.abspath(self.active_dir+fname)
+        indices = self.raw_Cs_indices(fname)
+        with open(path, 'rb') as f:
+            f.readline()
+            data_start = f.tell()
+        size = os.path.getsize(path)
+        ranges = [(path, start, min(start+chunk_bytes, size)) for start in range(data_start, size, chunk_bytes)]
+
+        with Pool(self.n_workers) as pool:
+            # rows of each range first, so every range knows where its rows go
+            counts = pool.map(count_raw_Cs_range, ranges)
+            if sum(counts) == 0:
+                raise ValueError(f'{fname} has no state rows')
+            first_range = ranges[next(i for i, count in enumerate(counts) if count > 0)]
+            first_line = self.read_raw_Cs_range(*first_range)[:1]
+            shapes = [array.shape[1:] for array in self.featurize_raw_Cs_lines(first_line, indices, max_units, fast, mask)[0]]
+            columns, label_column = self.create_columns(dirname, sum(counts), shapes, [np.int8] * len(self.COLUMNS))
+            self.flush_columns(columns, label_column)
+            del columns, label_column
+
+            offsets = np.cumsum([0] + counts[:-1]).tolist()
+            columns_path = os.path.abspath(self.active_dir+dirname)
+            written = pool.map(convert_raw_Cs_range, [(path, start, end, offset, indices, columns_path, max_units, fast, mask, batch_size)
+                                                      for (path, start, end), offset in zip(ranges, offsets)])
+        print(f'Converted {sum(written)} maps from {fname} to {dirname}')
+
+    def raw_Cs_indices(self, fname):
+        # positions of the map, unitlist and result fields in the header of a raw C# output CSV
+        with open(self.active_dir+fname) as f:
+            header = f.readline().strip().split(':')
+        return header.index('map'), header.index('unitlist'), header.index('result')
+
+    @staticmethod
+    def read_raw_Cs_range(path, start, end):
+        """State lines of a raw C# output CSV that start in the byte range [start, end)"""
+        with open(path, 'rb') as f:
+            # skip the line that started before the range (if start is a line start, this reads its newline)
+            f.seek(max(start-1, 0))
+            if start > 0:
+                f.readline()
+            block = f.read(max(end-f.tell(), 0))
+            if block and not block.endswith(b'\n'):
+                block += f.readline()
+        # state lines start with the map; the rest are headers and WLD summaries
+        return [line.decode() for line in block.split(b'\n') if line.startswith(b'[')]
+
+    @staticmethod
+    def parse_raw_Cs_lines(lines, indices, max_units):
+        """
+        Terrain (N x X x Y), states array and unit counts (see MapUtils.units_to_array) and labels
+        of raw C# output state lines (see Logger.AddTurnRecord). The cells are nested lists of
+        integers, so each column is parsed with a single np.fromstring over all its lines.
+        """
+        map_index, units_index, result_index = indices
+        rows = [line.rstrip('\r').split(':') for line in lines if line.startswith('[')]
+        brackets = str.maketrans('', '', '[]')
+
+        map_cells = [row[map_index] for row in rows]
+        if not rows:
+            terrain = np.zeros((0, 0, 0), dtype=np.int64)
+        elif any(cell.count('[') != map_cells[0].count('[') or cell.count(',') != map_cells[0].count(',') for cell in map_cells):
+            raise ValueError('maps of different sizes')
+        else:
+            terrain = np.fromstring(','.join(map_cells).translate(brackets), dtype=np.int64, sep=',')
+            terrain = terrain.reshape(len(rows), map_cells[0].count('[') - 1, -1)
+
+        unit_cells = [row[units_index] for row in rows]
+        counts = np.array([cell.count('[') - 1 for cell in unit_cells], dtype=np.int64)
+        if len(counts) > 0 and counts.max() > max_units:
+            raise ValueError("state has " + str(counts.max()) + " units, more than max_units=" + str(max_units))
+        states = np.zeros((len(rows), max_units, MapUtils.UNIT_FIELDS), dtype=np.int64)
+        total = int(counts.sum())
+        if total > 0:
+            units = np.fromstring(','.join(cell for cell in unit_cells if cell != '[]').translate(brackets), dtype=np.int64, sep=',')
+            units = units.reshape(total, -1)[:, :MapUtils.UNIT_FIELDS]
+            state_index = np.repeat(np.arange(len(rows)), counts)
+            unit_index = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            states[state_index, unit_index] = units
+
+        labels = np.array([float(row[result_index]) for row in rows], dtype=np.float32)
+        return terrain, states, counts, labels
+
+    @staticmethod
+    def featurize_raw_Cs_lines(lines, indices, max_units=6, fast=True, mask=False):
+        """Data columns (arrays, create_data_matrices order) and labels of raw C# output state lines"""
+        terrain, states, counts, labels = DataLoader.parse_raw_Cs_lines(lines, indices, max_units)
+        if fast or len(labels) == 0:
+            # the batch path also gives the empty columns of a batch without states their rank
+            return MapUtils.create_data_matrices_batch(states, counts, terrain, max_units, mask), labels
+        rows = []
+        for state, count, map_matrix in zip(states, counts, terrain.tolist()):
+            unit_list = [UnitData(*unit) for unit in state[:count].tolist()]
+            rows.append(MapUtils.create_data_matrices(unit_list, map_matrix, max_units, fast, mask))
+        data = [np.array([row[i] for row in rows], dtype=np.float32) for i in range(len(DataLoader.COLUMNS))]
+        return data, labels
+
+    def is_columns(self, dirname):
+        return os.path.exists(os.path.join(self.active_dir+dirname, self.MANIFEST))
+
+    @staticmethod
+    def column_dtype(array):
+        """int8 if every value of array is an integer that fits, else float32"""
+        if array.size == 0:
+            return np.int8
+        fits = array.min() >= -128 and array.max() <= 127 and np.array_equal(array.astype(np.int8), array)
+        return np.int8 if fits else np.float32
+
+    def convert_csv_to_columns(self, fname, dirname, chunksize=10000):
+        """Convert a CSV saved by save_data/save_data_cols to the columnar format, chunk by chunk"""
+        count = self.count_csv_rows(fname)
+        columns, label_column = None, None
+        position = 0
+        for chunk in pd.read_csv(self.active_dir+fname, chunksize=chunksize):
+            # the cells are nested lists of numbers, which json parses much faster than eval
+            arrays = [np.array([json.loads(cell) for cell in chunk[name]]) for name in self.COLUMNS]
+            if columns is None:
+                dtypes = [self.column_dtype(array) for array in arrays]
+                columns, label_column = self.create_columns(dirname, count, [array.shape[1:] for array in arrays], dtypes)
+            for name, column, array in zip(self.COLUMNS, columns, arrays):
+                if array.shape[1:] != column.shape[1:] or not np.array_equal(array.astype(column.dtype), array):
+                    raise ValueError(f'column {name} of rows {position}.. does not fit {column.dtype} {column.shape[1:]}')
+                column[position:position+len(array)] = array
+            label_column[position:position+len(chunk)] = chunk[self.LABEL_COLUMN].to_numpy()
+            position += len(chunk)
+        if columns is None:
+            raise ValueError(f'{fname} has no rows')
+        self.flush_columns(columns, label_column)
+        print(f'Converted {position} maps from {fname} to {dirname}')
+
+    def convert_tensors_to_columns(self, filename, dirname):
+        """Convert tensors saved by save_tensors to the columnar format"""
+        data_tensors, label_tensors = self.load_tensors(filename)
+        self.save_columns([tensor.numpy() for tensor in data_tensors], label_tensors.numpy(), dirname)
+
+    def count_csv_rows(self, fname, block_size=1 << 24):
+        # rows of a CSV with a header line and no line breaks inside cells
+        count = 0
+        last = b'\n'
+        with open(self.active_dir+fname, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                count += block.count(b'\n')
+                last = block[-1:]
+        if last != b'\n':
+            count += 1
+        return count - 1
 
     def test_map_balance(self, n, player_id=0):
         #  run one game on each map, get the labels, and print distribution of results (%)
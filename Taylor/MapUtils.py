@@ -1,11 +1,18 @@
 from networkx import adjacency_matrix
+import numpy as np
 from UnitData import *
+from Consts import Consts
+from DamageTable import DamageTable
 from UnitDistanceCalculator import UnitDistanceCalculator
 
 class MapUtils:
 
     calculator = UnitDistanceCalculator()
 
+    # fields of a unit in the state arrays of the batch functions, in UnitData order
+    F_X, F_Y, F_TYPE, F_TEAM, F_HP, F_MOVED = range(6)
+    UNIT_FIELDS = 6
+
     @staticmethod
     def map_to_string(map_matrix, unit_list):
         x_size = len(map_matrix[0])
@@ -277,6 +284,94 @@ class MapUtils:
         output = (can_access, feature_matrix, man_distance, counterattack, damage)
         return output
 
+    @staticmethod
+    def units_to_array(unit_lists, max_units):
+        """States array (N x max_units x UNIT_FIELDS) and unit counts of a list of unit lists"""
+        states = np.zeros((len(unit_lists), max_units, MapUtils.UNIT_FIELDS), dtype=np.int64)
+        counts = np.zeros(len(unit_lists), dtype=np.int64)
+        for n, units in enumerate(unit_lists):
+            if len(units) > max_units:
+                raise ValueError("state has " + str(len(units)) + " units, more than max_units=" + str(max_units))
+            for i, unit in enumerate(units):
+                states[n, i] = (unit.x, unit.y, unit.type, unit.team, unit.hp, 1 if unit.moved else 0)
+            counts[n] = len(units)
+        return states, counts
+
+    @staticmethod
+    def create_data_matrices_batch(states, counts, map, max_units, mask=False):
+        """
+        create_data_matrices (fast) for a batch of states: the ten columns as float32 arrays.
+        map is the terrain of every state, or one terrain per state (N x map).
+        """
+        return list(MapUtils.create_gcn_input_batch(states, counts, map, max_units, mask)) + \
+               list(MapUtils.create_cnn_input_batch(states, counts, map))
+
+    @staticmethod
+    def create_gcn_input_batch(states, counts, map, max_units, mask=False):
+        """
+        create_gcn_input_fast for a batch of states, with the mask of create_data_matrices.
+
+        states is N x max_units x UNIT_FIELDS (see units_to_array), the first counts[n] rows of
+        state n being its units; map is indexed [x][y] as in create_gcn_input_fast, shared or
+        one per state. Returns (can_access, feature, manhattan, counterattack, damage) as
+        contiguous float32 arrays of N x max_units x max_units (N x max_units x 4 for feature).
+        """
+        states = np.asarray(states)
+        n_states = len(states)
+        terrain = np.asarray(map)
+        if terrain.ndim == 2:
+            terrain = terrain[np.newaxis]
+
+        # padding rows are zeroed, so they index the tables like a unit with 0 HP at (0, 0)
+        exists = np.arange(max_units) < np.asarray(counts)[:, np.newaxis]
+        x, y, types, team, hp = np.where(exists, np.moveaxis(states[:, :, :MapUtils.F_MOVED], -1, 0), 0)
+
+        # (i, j) pairs of units that exist, and of units on different teams
+        pairs = exists[:, :, np.newaxis] & exists[:, np.newaxis, :]
+        enemies = pairs & (team[:, :, np.newaxis] != team[:, np.newaxis, :])
+
+        man_distance = np.abs(x[:, :, np.newaxis] - x[:, np.newaxis, :]) + np.abs(y[:, :, np.newaxis] - y[:, np.newaxis, :])
+        man_distance = np.where(pairs, man_distance, 0)
+
+        movement = np.array(ConstsData.movement_arr)[types]
+        can_access = enemies & (man_distance <= movement[:, :, np.newaxis] + 1)
+        if mask:
+            # only attacks across the two halves of the unit list, as in create_data_matrices
+            half = np.arange(max_units) < max_units // 2
+            can_access &= half[:, np.newaxis] != half[np.newaxis, :]
+
+        red = team == 0
+        feature = np.stack([hp, np.where(red, types, -types), movement,
+                            np.where(red, states[:, :, MapUtils.F_MOVED] != 0, 1)], axis=-1)
+        feature = np.where(exists[:, :, np.newaxis], feature, 0)
+
+        # damage of i attacking j and the counterattack, looked up with the terrain stars of both
+        stars = np.array(Consts.FIELD_DEFENSE)[terrain[(np.arange(n_states) % len(terrain))[:, np.newaxis], x, y]]
+        damage = DamageTable.DAMAGE[types[:, :, np.newaxis], hp[:, :, np.newaxis], types[:, np.newaxis, :],
+                                    hp[:, np.newaxis, :], stars[:, np.newaxis, :]]
+        counterattack = DamageTable.COUNTER[types[:, :, np.newaxis], hp[:, :, np.newaxis], types[:, np.newaxis, :],
+                                            hp[:, np.newaxis, :], stars[:, np.newaxis, :], stars[:, :, np.newaxis]]
+
+        return (can_access.astype(np.float32), feature.astype(np.float32), man_distance.astype(np.float32),
+                np.where(enemies, counterattack, 0).astype(np.float32), np.where(enemies, damage, 0).astype(np.float32))
+
+    @staticmethod
+    def create_cnn_input_batch(states, counts, map):
+        """create_cnn_input for a batch of states (see create_gcn_input_batch), as float32 arrays"""
+        states = np.asarray(states)
+        terrain = np.asarray(map, dtype=np.float32)
+        n_states = len(states)
+        exists = np.arange(states.shape[1]) < np.asarray(counts)[:, np.newaxis]
+        index, unit = np.nonzero(exists)
+        x = states[index, unit, MapUtils.F_X]
+        y = states[index, unit, MapUtils.F_Y]
+
+        matrices = [np.zeros((n_states, terrain.shape[-1], terrain.shape[-2]), dtype=np.float32) for _ in range(4)]
+        for matrix, field in zip(matrices, (MapUtils.F_TYPE, MapUtils.F_TEAM, MapUtils.F_HP, MapUtils.F_MOVED)):
+            matrix[index, x, y] = states[index, unit, field]
+        map_matrix = np.ascontiguousarray(np.broadcast_to(terrain, (n_states,) + terrain.shape[-2:]))
+        return tuple([map_matrix] + matrices)
+
     # add padding to make all cells 3 characters wide
     # format [x, x, ..., x] where x is the same width each time
     def print_matrix(matrix):
@@ -7,11 +7,17 @@ from tensorflow.keras.callbacks import LearningRateScheduler
 from spektral.layers import GCNConv
 import numpy as np
 import os
+import re
+import sys
 import math
 from sklearn.metrics import confusion_matrix, classification_report, accuracy_score
 
 class NNModel:
 
+    custom_objects = {
+        'GCNConv': GCNConv
+    }
+
     def __init__(self, model_name):
         self.learning_rate = 0.001
         self.lr_decay = 0.97
@@ -36,6 +42,15 @@ class NNModel:
         self.epsilon = 0.5
         self.print_interval = 10
 
+        # inference engine used by perform_inference:
+        # 'predict' = keras model.predict, 'function' = compiled tf.function, 'tflite' = TFLite interpreter (XNNPACK on CPU)
+        self.inference_backend = 'function'
+        self.batch_buckets = [1, 16, 64, 256] # batches are padded to one of these sizes, each size is compiled once
+        self.tflite_threads = None # interpreter threads, None = TFLite default
+        self.inference_model = None # model the compiled functions / interpreters below were built for
+        self.inference_functions = {} # bucket -> concrete function
+        self.tflite_interpreters = {} # bucket -> interpreter
+
     def interpret_output(self, x):
         if x < -1*self.epsilon:
             return -1
@@ -55,11 +70,90 @@ class NNModel:
         print('model dir set to ', self.model_dir)
 
     def perform_inference(self, inference_input):
-        continuous_predictions = self.active_model.predict(inference_input)
+        if self.inference_backend == 'predict':
+            continuous_predictions = self.active_model.predict(inference_input)
+        else:
+            continuous_predictions = self.bucketed_inference(inference_input)
         predicted_classes = np.array(x for x in continuous_predictions.flatten())
         # predicted_classes = np.array([self.interpret_output(x) for x in continuous_predictions.flatten()])
         return continuous_predictions, predicted_classes
 
+    def bucketed_inference(self, inference_input):
+        # pad the batch to the next bucket size so the compiled function / interpreter for that size is reused,
+        # batches larger than the largest bucket are run in chunks of that size
+        if self.inference_model is not self.active_model:
+            self.reset_inference()
+        inputs = [np.asarray(x, dtype=np.float32) for x in inference_input]
+        count = len(inputs[0])
+        largest = self.batch_buckets[-1]
+        outputs = []
+        for start in range(0, count, largest):
+            chunk = [x[start:start + largest] for x in inputs]
+            n = len(chunk[0])
+            bucket = next(b for b in self.batch_buckets if b >= n)
+            if bucket > n:
+                chunk = [np.pad(x, [(0, bucket - n)] + [(0, 0)] * (x.ndim - 1)) for x in chunk]
+            if self.inference_backend == 'tflite':
+                output = self.run_tflite(chunk, bucket)
+            else:
+                output = self.get_inference_function(bucket)(*[tf.constant(x) for x in chunk]).numpy()
+            outputs.append(output[:n])
+        if not outputs:
+            return np.zeros((0, 1), dtype=np.float32)
+        return np.concatenate(outputs)
+
+    def reset_inference(self):
+        self.inference_model = self.active_model
+        self.inference_functions = {}
+        self.tflite_interpreters = {}
+
+    def get_inference_function(self, bucket):
+        # tf.function traced once for a fixed input signature of batch size bucket
+        function = self.inference_functions.get(bucket)
+        if function is None:
+            model = self.active_model
+            signature = [tf.TensorSpec((bucket,) + tuple(x.shape[1:]), tf.float32) for x in model.inputs]
+            function = tf.function(lambda *inputs: model(list(inputs), training=False)).get_concrete_function(*signature)
+            self.inference_functions[bucket] = function
+        return function
+
+    def tflite_fname(self):
+        return re.sub(r'\.keras$', '', self.model_fname) + '.tflite'
+
+    def run_tflite(self, inputs, bucket):
+        interpreter = self.tflite_interpreters.get(bucket)
+        if interpreter is None:
+            # the default op resolver delegates float ops to XNNPACK on CPU
+            interpreter = tf.lite.Interpreter(model_path=self.tflite_fname(), num_threads=self.tflite_threads)
+            for detail in interpreter.get_input_details():
+                interpreter.resize_tensor_input(detail['index'], [bucket] + list(detail['shape'][1:]))
+            interpreter.allocate_tensors()
+            self.tflite_interpreters[bucket] = interpreter
+        for detail, x in zip(self.tflite_input_order(interpreter.get_input_details()), inputs):
+            interpreter.set_tensor(detail['index'], x)
+        interpreter.invoke()
+        return interpreter.get_tensor(interpreter.get_output_details()[0]['index'])
+
+    @staticmethod
+    def tflite_input_order(details):
+        # convert_to_tflite names the inputs input_0, input_1, ... in model input order
+        return sorted(details, key=lambda detail: int(re.search(r'input_(\d+)', detail['name']).group(1)))
+
+    def convert_to_tflite(self, tflite_fname=None):
+        # write the active model as a float TFLite model for the 'tflite' backend, next to the checkpoint by default
+        if tflite_fname is None:
+            tflite_fname = self.tflite_fname()
+        model = self.active_model
+        signature = [tf.TensorSpec((None,) + tuple(x.shape[1:]), tf.float32, name=f'input_{i}') for i, x in enumerate(model.inputs)]
+        function = tf.function(lambda *inputs: model(list(inputs), training=False), input_signature=signature)
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([function.get_concrete_function()], model)
+        # builtin ops run on XNNPACK, anything else falls back to TF ops
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+        with open(tflite_fname, 'wb') as f:
+            f.write(converter.convert())
+        print('saved tflite model ', tflite_fname)
+        return tflite_fname
+
     # eval set already transformed into correct format to load into model
     def evaluate(self, eval_input, eval_labels, verbose=True):
         print(f"evaluating {len(eval_labels)} points...")
@@ -113,10 +207,15 @@ class NNModel:
         # else:
         #     self.active_model.fit(training_input, training_labels, epochs=epochs, batch_size=batch_size, verbose=0, callbacks=callbacks)
         # Train the model and store the training history
+        # training_labels is None when training_input is a tf.data.Dataset of (inputs, labels) batches
+        if training_labels is None:
+            fit_data, batch_size = (training_input,), None
+        else:
+            fit_data = (training_input, training_labels)
         if verbose:
-            history = self.active_model.fit(training_input, training_labels, epochs=epochs, batch_size=batch_size, callbacks=callbacks)
+            history = self.active_model.fit(*fit_data, epochs=epochs, batch_size=batch_size, callbacks=callbacks)
         else:
-            history = self.active_model.fit(training_input, training_labels, epochs=epochs, batch_size=batch_size, verbose=0, callbacks=callbacks)
+            history = self.active_model.fit(*fit_data, epochs=epochs, batch_size=batch_size, verbose=0, callbacks=callbacks)
 
         # Extract losses and epoch numbers
         losses = history.history.get('loss', [])
@@ -127,11 +226,8 @@ class NNModel:
     def load_model(self, model_name=None):
         # If file {model_fname} exists, load the model from the file
         # Otherwise, create a new model
-        custom_objects = {
-            'GCNConv': GCNConv
-        }
         try:
-            with keras.utils.custom_object_scope(custom_objects):
+            with keras.utils.custom_object_scope(NNModel.custom_objects):
                 if model_name is not None: 
                     self.update_model_name(model_name)
                     self.active_model = keras.models.load_model(self.model_dir + model_name)
@@ -184,4 +280,15 @@ class NNModel:
         if labels is None:
             return data_tensors
         labels = tf.convert_to_tensor(labels, dtype=tf.float32)
-        return data_tensors, labels
\ No newline at end of file
+        return data_tensors, labels
+
+
+# convert an existing checkpoint for the 'tflite' inference backend:
+#   python NNModel.py models/<dir>/<model>.keras [output.tflite]
+if __name__ == '__main__':
+    model_dir, model_name = os.path.split(sys.argv[1])
+    nn_model = NNModel(model_name)
+    nn_model.set_model_dir(model_dir + '/')
+    with keras.utils.custom_object_scope(NNModel.custom_objects):
+        nn_model.active_model = keras.models.load_model(sys.argv[1])
+    nn_model.convert_to_tflite(sys.argv[2] if len(sys.argv) > 2 else None)
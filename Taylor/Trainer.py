@@ -2,6 +2,7 @@ import time
 import os
 import json
 import matplotlib.pyplot as plt
+import numpy as np
 
 
 # from NNModel import NNModel
@@ -50,6 +51,10 @@ class Trainer:
         self.data_loader = DataLoader(self.active_dir)
 
 
+    def selected_columns(self):
+        # indices of the data columns the model takes
+        return self.model.select_data(list(range(len(DataLoader.COLUMNS))))
+
     def update_training_log(self, str):
         # get log name
         log_name = self.active_dir + self.model_name[:-6] + '.log'
@@ -75,16 +80,25 @@ class Trainer:
         plt.savefig(plot_name)  # or .jpg, .pdf, etc.
         plt.close()
 
-    def train(self, training_fname, batch_size, epochs=1):
+    def train(self, training_fname, batch_size, epochs=1, streaming=False, max_units=6, fast=True, mask=False):
+        # streaming: training_fname is a raw C# output CSV, featurized on the fly (max_units, fast and mask as in load_raw_Cs_output)
         self.update_training_log(f"train({training_fname}, {epochs})")
         data, labels = None, None
-        if training_fname.endswith('.csv'):
-            data, labels = self.data_loader.load_dataframe(training_fname)
-            data, labels = self.data_loader.tensorize_data(data, labels)
+        if streaming:
+            dataset = self.data_loader.raw_Cs_dataset(training_fname, batch_size, self.selected_columns(), max_units, fast, mask)
+            loss_data, epoch_data = self.model.train(dataset, None, batch_size=batch_size, epochs=epochs)
+        elif self.data_loader.is_columns(training_fname):
+            # memory-mapped, read batch by batch
+            dataset = self.data_loader.columns_dataset(training_fname, batch_size, self.selected_columns())
+            loss_data, epoch_data = self.model.train(dataset, None, batch_size=batch_size, epochs=epochs)
         else:
-            data, labels = self.data_loader.load_tensors(training_fname)
-        selected_data = self.model.select_data(data)
-        loss_data, epoch_data = self.model.train(selected_data, labels, batch_size=batch_size, epochs=epochs)
+            if training_fname.endswith('.csv'):
+                data, labels = self.data_loader.load_dataframe(training_fname)
+                data, labels = self.data_loader.tensorize_data(data, labels)
+            else:
+                data, labels = self.data_loader.load_tensors(training_fname)
+            selected_data = self.model.select_data(data)
+            loss_data, epoch_data = self.model.train(selected_data, labels, batch_size=batch_size, epochs=epochs)
         self.graph_training_loss(epoch_data, loss_data)
         training_losses = {"epochs": epoch_data, "losses": loss_data}
         self.update_training_log(f"Training Losses: {json.dumps(training_losses)}")
@@ -97,9 +111,13 @@ class Trainer:
         if eval_fname.endswith('.csv'):
             data, labels = self.data_loader.load_dataframe(eval_fname)
             data, labels = self.data_loader.tensorize_data(data, labels)
+        elif self.data_loader.is_columns(eval_fname):
+            selected_data = self.data_loader.columns_dataset(eval_fname, 256, self.selected_columns(), shuffle=False)
+            labels = np.array(self.data_loader.load_columns(eval_fname, mmap_mode='r')[1])
         else:
             data, labels = self.data_loader.load_tensors(eval_fname)
-        selected_data = self.model.select_data(data)
+        if data is not None:
+            selected_data = self.model.select_data(data)
         accuracy, conf_matrix, class_report = self.model.evaluate(selected_data, labels)
 
         self.update_training_log(f"accuracy: {accuracy}")
@@ -1,3 +1,11 @@
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'port')))
+from Consts import Consts
+from DamageTable import DamageTable
+
+
 class ConstsData:
 
 
@@ -10,13 +18,6 @@ class ConstsData:
     ANTIAIR = unitNames.index("antiair")
     INFANTRY = unitNames.index("infantry")
     
-    dmg_matrix = [  [55, 65, 0, 0, 0, 0],
-                    [0, 0, 105, 105, 85, 115],
-                    [0, 0, 55, 70, 75, 75],
-                    [0, 0, 60, 75, 65, 90],
-                    [70, 70, 15, 50, 45, 105],
-                    [0, 0, 5, 10, 3, 55]]
-
     # 0 = barrier, 1 = plain, 2 = sea, 3 = forest, 4 = mountain, 5 = road
     # move_matrix = [ [10, 1, 1, 1, 1, 1],
     #                 [10, 1, 1, 1, 1, 1],
@@ -33,13 +34,6 @@ class ConstsData:
         [99, 1, 99, 2, 99, 1],  # R
         [99, 1, 99, 1, 2, 1]    # I
     ]
-    def_matrix = [ [0, 0, 0, 0, 0, 0],
-                    [0, 0 ,0, 0, 0, 0],
-                    [0, .1, 0, .3, .4, 0],
-                    [0, .1, 0, .3, .4, 0],
-                    [0, .1, 0, .3, .4, 0],
-                    [0, .1, 0, .3, .4, 0],]
-
     movement_arr = [9,7,6,5,6,3]
 
 
@@ -66,17 +60,10 @@ class UnitData:
         return ConstsData.move_cost[self.type][terrain]
 
     def calc_dmg(self, defender, terrain, atk_terrain=None):
-        # taken from calculation in DamageCalculator.cs:
-        #      int rawDamage = ((atkPower * atkHP) + 70) / (100 + (targetStars * targetHP));
-        dmg = int((ConstsData.dmg_matrix[self.type][defender.type] * self.hp + 70) / (100+10*ConstsData.def_matrix[defender.type][terrain] * defender.hp))
-        if dmg > defender.hp:
-            dmg = defender.hp
-        if atk_terrain is not None:
-            # calculate counterattack
-            counter_dmg = -1
-            if dmg == defender.hp:
-                counter_dmg = int((ConstsData.dmg_matrix[defender.type][self.type] * defender.hp - dmg + 70) / (100+10*ConstsData.def_matrix[self.type][atk_terrain] * self.hp))
-                if counter_dmg > self.hp:
-                    counter_dmg = self.hp
-            return dmg, counter_dmg
-        return dmg
+        # same table as DamageCalculator.cs / DamageCalculator.py; terrain is converted to stars
+        stars = Consts.FIELD_DEFENSE[terrain]
+        if atk_terrain is None:
+            return DamageTable.damage(self.type, self.hp, defender.type, defender.hp, stars)
+        # with the attacker's terrain, also return the counterattack (0 if there is none)
+        dmg, counter_dmg = DamageTable.damages(self.type, self.hp, defender.type, defender.hp, Consts.FIELD_DEFENSE[atk_terrain], stars)
+        return dmg, counter_dmg
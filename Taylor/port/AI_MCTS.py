@@ -1,9 +1,11 @@
 from MGameTree import MGameTree
 from MTools import MTools
+from RolloutKernel import RolloutKernel
+from SelectionPolicy import UCB1
 
 from Player import Player
-import time
-import math
+from SearchBudget import SearchBudget
+from TreeReuse import TreeReuse
 import random
 
 
@@ -12,6 +14,8 @@ class AI_M_UCT(Player):
     MAX_SIM = 200  # Number of simulations per action
     SIM_THRESHOLD = 10  # Threshold for expanding child nodes during tree search
     UCB_CONST = 0.15  # Constant for UCB value calculation
+    SELECTION = UCB1(UCB_CONST)  # Child selection policy (UCB1, UCB1Tuned or PUCT) with its constant
+    COMPILED_ROLLOUT = True  # Run playouts with RolloutKernel instead of random_simulation
 
     # Debug variables
     max_depth = 0
@@ -23,8 +27,8 @@ class AI_M_UCT(Player):
     LIMIT_TIME = 9700  # Time per turn in milliseconds
 
     def __init__(self):
-        self.stopwatch = time.time()
-        self.time_left = AI_M_UCT.LIMIT_TIME
+        self.budget = SearchBudget()
+        self.reuse = TreeReuse()
 
     def get_name(self):
         return "M-UCT"
@@ -33,19 +37,27 @@ class AI_M_UCT(Player):
         return ""
 
     def make_action(self, map_, team_color, turn_start, game_start):
+        self.budget.start(turn_start, len(map_.get_units_list(team_color, False, True, False)),
+                          turn_time_ms=AI_M_UCT.LIMIT_TIME, max_rollouts=AI_M_UCT.MAX_SIM)
 
         # print('Starting action decision process')
 
-        # Create root node
-        root = self.make_root(map_, team_color)
+        # Continue from the subtree of the previous action if possible, else create a root node
+        root = self.reuse.take(map_, team_color)
+        if root is None:
+            root = self.make_root(map_, team_color)
 
-        AI_M_UCT.total_simulations = 0
+        AI_M_UCT.total_simulations = sum(child.simnum for child in root.next)
 
-        for i in range(AI_M_UCT.MAX_SIM):
+        while not self.budget.is_exhausted():
             self.search(root, team_color)
             AI_M_UCT.total_simulations += 1
+            self.budget.add_rollouts()
+        self.budget.stop()
 
-        return self.max_rate_action(root)
+        action = self.max_rate_action(root)
+        self.reuse.keep(root, action, map_, team_color)
+        return action
 
     @staticmethod
     def make_root(map_, team_color):
@@ -78,24 +90,12 @@ class AI_M_UCT(Player):
             AI_M_UCT.max_depth = node.depth
 
         enemy_color = AI_M_UCT.get_enemy_color(team_color)
-        max_id = 0
-        max_ucb = -1
-
-        for j, child in enumerate(node.next):
-            tmp_ucb = self.evaluate_uct(child)
-
-            if tmp_ucb == 100:
-                max_ucb = tmp_ucb
-                max_id = j
-                break
-
-            if tmp_ucb > max_ucb:
-                max_ucb = tmp_ucb
-                max_id = j
 
         if len(node.next) == 0:
             return
 
+        max_id = AI_M_UCT.SELECTION.select_from(node.next, AI_M_UCT.total_simulations)
+
         if node.next[max_id].simnum > AI_M_UCT.SIM_THRESHOLD:
             if len(node.next[max_id].next) == 0:
                 if len(node.next[max_id].board.get_units_list(team_color, False, True, False)) > 0:
@@ -116,15 +116,15 @@ class AI_M_UCT(Player):
                 if best_child:
                     child_node.last_score = best_child.last_score
                     child_node.total_score += child_node.last_score
+                    child_node.sq_score += child_node.last_score * child_node.last_score
                     child_node.housyuu = child_node.total_score / child_node.simnum
                 
                 AI_M_UCT.last_id = max_id
         else:
-            result = self.random_simulation(node.next[max_id].board, team_color)
-
             node.next[max_id].simnum += 1
-            node.next[max_id].last_score = self.evaluate_state_value(result, team_color)
+            node.next[max_id].last_score = self.playout(node.next[max_id].board, team_color)
             node.next[max_id].total_score += node.next[max_id].last_score
+            node.next[max_id].sq_score += node.next[max_id].last_score * node.next[max_id].last_score
             node.next[max_id].housyuu = node.next[max_id].total_score / node.next[max_id].simnum
 
             AI_M_UCT.last_id = max_id
@@ -144,10 +144,16 @@ class AI_M_UCT(Player):
 
         return root.next[return_id].act
 
+    def playout(self, board, team_color):
+        """Score of one playout from board, from team_color's point of view"""
+        if AI_M_UCT.COMPILED_ROLLOUT:
+            return RolloutKernel.rollout_value(board, team_color)
+        return self.evaluate_state_value(self.random_simulation(board, team_color), team_color)
+
     def random_simulation(self, map_, team_color):
         enemy_color = AI_M_UCT.get_enemy_color(team_color)
         sim_map = map_.create_deep_clone()
-        rand_gen = random.Random()
+        rand_gen = random.Random(random.getrandbits(32))  # Seeded from the random module, so random.seed() reproduces playouts
 
         while sim_map.get_turn_count() < sim_map.get_turn_limit():
             sim_units = sim_map.get_units_list(team_color, False, True, False)
@@ -217,13 +223,6 @@ class AI_M_UCT(Player):
             child.board.execute_action(action)
             node.next.append(child)
 
-    @staticmethod
-    def evaluate_uct(node):
-        if node.simnum == 0:
-            return 100
-        else:
-            return node.housyuu + AI_M_UCT.UCB_CONST * math.sqrt(math.log(AI_M_UCT.total_simulations) / node.simnum)
-
     @staticmethod
     def evaluate_state_value(map_, team_color):
         enemy_color = AI_M_UCT.get_enemy_color(team_color)
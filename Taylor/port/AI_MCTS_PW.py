@@ -0,0 +1,91 @@
+import math
+
+from AI_MCTS import AI_M_UCT
+from AI_Simple import AI_Sample_MaxActEval
+from Action import Action
+from DamageCalculator import DamageCalculator
+from MGameTree import MGameTree
+from MTools import MTools
+
+
+class AI_M_UCT_PW(AI_M_UCT):
+    """
+    M-UCT with progressive widening, the port of AI_M_UCT_PW.cs.
+
+    Expanding a node does not create one child per action. The actions are ordered by a
+    cheap prior and kept in node.untried: attacks first, by the value
+    AI_Sample_MaxActEval.evaluate_attack_action_value gives them (without the enemy
+    threat term), then moves, by the score AI_Sample_MaxActEval moves by. A node whose
+    children have n visits in total has ceil(PW_C * (n + 1) ** PW_ALPHA) children, so the
+    next untried actions become children as the visits grow. Children get decreasing
+    priors in that order, which PUCT selection uses.
+    """
+    PW_ALPHA = 0.4  # Growth rate of the number of children
+    PW_C = 2        # Scale of the number of children
+
+    def get_name(self):
+        return "M-UCT-PW"
+
+    def show_parameters(self):
+        return "PW_C=" + str(AI_M_UCT_PW.PW_C) + " PW_ALPHA=" + str(AI_M_UCT_PW.PW_ALPHA)
+
+    def make_root(self, map_, team_color):
+        root = MGameTree()
+        root.board = map_.create_deep_clone()
+        self.set_untried(root, team_color, False)
+        self.widen(root)
+        return root
+
+    def develop(self, node, team_color):
+        self.set_untried(node, team_color, len(node.board.get_units_list(team_color, True, False, False)) == 0)
+        self.widen(node)
+
+    def search(self, node, team_color):
+        self.widen(node)
+        super().search(node, team_color)
+
+    def set_untried(self, node, team_color, new_turn):
+        """Store the actions of team_color on node's board, ordered by prior"""
+        actions = []
+        for unit in node.board.get_units_list(team_color, False, True, False):
+            actions.extend(MTools.get_unit_actions(unit, node.board))
+        enemies = node.board.get_units_list(team_color, False, False, True)
+
+        # Ascending, so that untried.pop() takes the best action
+        actions.sort(key=lambda action: AI_M_UCT_PW.prior_score(action, node.board, enemies))
+        node.untried = actions
+        node.new_turn = new_turn
+
+    @staticmethod
+    def widen(node):
+        """Make untried actions children until node has as many as its visits allow"""
+        visits = sum(child.simnum for child in node.next)
+        allowed = max(1, math.ceil(AI_M_UCT_PW.PW_C * (visits + 1) ** AI_M_UCT_PW.PW_ALPHA))
+        while len(node.next) < allowed and node.untried:
+            child = MGameTree()
+            child.board = node.board.create_deep_clone()
+            if node.new_turn:
+                child.board.inc_turn_count()
+            child.act = node.untried.pop()
+            child.depth = node.depth + 1
+            child.prior = 1.0 / (len(node.next) + 1)
+            child.board.execute_action(child.act)
+            node.next.append(child)
+
+    @staticmethod
+    def prior_score(action, board, enemies):
+        """Sort key of an action: (is attack, value), higher is better"""
+        op_unit = board.get_unit(action.operation_unit_id)
+        if action.action_type == Action.ACTIONTYPE_MOVEANDATTACK:
+            damages = DamageCalculator.calculate_damages(board, action)
+            value = damages[0] * AI_Sample_MaxActEval.BASE_VALUE_OF_ENEMY - \
+                damages[1] * (AI_Sample_MaxActEval.BASE_VALUE_OF_MYUNIT + op_unit.get_HP())
+            return 1, value
+
+        # Approach enemies the unit is effective against
+        spec = op_unit.get_spec()
+        score = 0
+        for enemy_unit in enemies:
+            dist = abs(action.destination_x_pos - enemy_unit.get_x_pos()) + abs(action.destination_y_pos - enemy_unit.get_y_pos())
+            score = max(score, spec.get_unit_atk_power(enemy_unit.get_spec().get_unit_type()) // (dist + 5))
+        return 0, score
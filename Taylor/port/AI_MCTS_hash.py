@@ -1,18 +1,27 @@
-import time
-import math
 import random
 
+from CompactMap import CompactMap
 from MGameTree import MGameTree
 from MTools import MTools
+from RolloutKernel import RolloutKernel
+from SelectionPolicy import UCB1
 
 from Player import Player
+from SearchBudget import SearchBudget
+from TranspositionTable import TranspositionTable
+from TreeReuse import TreeReuse
 
 class AI_M_UCT(Player):
     # Parameters
     MAX_SIM = 200      # Number of simulations per action
     SIM_THRESHOLD = 10 # Threshold for expanding child nodes during tree search
     UCB_CONST = 0.15   # Constant for UCB value calculation
+    SELECTION = UCB1(UCB_CONST)  # Child selection policy (UCB1, UCB1Tuned or PUCT) with its constant
     LIMIT_TIME = 9700  # Time per turn in milliseconds
+    COMPACT_STATE = True  # Search on CompactMap boards (clone = one buffer copy)
+    COMPILED_ROLLOUT = True  # Run playouts with RolloutKernel instead of random_simulation
+    TT_SIZE = 100000   # Maximum number of entries in each team's transposition table
+    TT_POLICY = TranspositionTable.LRU  # Replacement policy of the transposition tables
 
     # Debug variables
     max_depth = 0
@@ -20,51 +29,57 @@ class AI_M_UCT(Player):
     last_id = 0
     movable_unit_num = 0
 
-    # --- NEW: Our global transposition table ---
-    # Maps a state_hash -> MGameTree node
-    # The node keeps track of simnum, total_score, children, etc.
-    transposition_table = {}
-
     def __init__(self):
-        self.stopwatch = time.time()
-        self.time_left = AI_M_UCT.LIMIT_TIME
+        self.budget = SearchBudget()
+        self.reuse = TreeReuse()
+        # Scores are seen from the searching team, so each team has its own table.
+        # Tree nodes keep their board and children; their statistics live in the table.
+        self.tables = [TranspositionTable(AI_M_UCT.TT_SIZE, AI_M_UCT.TT_POLICY) for _ in range(2)]
+        self.table = self.tables[0]
 
     def get_name(self):
         return "M-UCT with Hash"
 
     def show_parameters(self):
-        return ""
+        return "tt_size=" + str(AI_M_UCT.TT_SIZE) + " tt_policy=" + AI_M_UCT.TT_POLICY
 
     def make_action(self, map_, team_color, turn_start, game_start):
-        # Create root node (or reuse if seen)
+        self.budget.start(turn_start, len(map_.get_units_list(team_color, False, True, False)),
+                          turn_time_ms=AI_M_UCT.LIMIT_TIME, max_rollouts=AI_M_UCT.MAX_SIM)
+        self.table = self.tables[team_color]
+
+        # Create root node (or reuse the subtree of the previous action)
         root = self.make_root(map_, team_color)
 
         # Reset debug counters
-        AI_M_UCT.total_simulations = 0
+        AI_M_UCT.total_simulations = sum(child.entry.simnum for child in root.next)
         AI_M_UCT.max_depth = 0
 
         # Core MCTS iteration
-        for i in range(AI_M_UCT.MAX_SIM):
+        while not self.budget.is_exhausted():
             self.search(root, team_color)
             AI_M_UCT.total_simulations += 1
+            self.budget.add_rollouts()
+        self.budget.stop()
 
-        return self.max_rate_action(root)
+        action = self.max_rate_action(root)
+        self.reuse.keep(root, action, map_, team_color)
+        return action
 
     def make_root(self, map_, team_color):
         """
-        Construct or retrieve the root node for the current map/team_color.
+        Construct the root node for the current map/team_color, or promote the child of the
+        previous action if map_ is the position it leads to.
         """
-        # Compute the hash of the current board
-        state_key = self.get_state_hash(map_)
-
-        # If we've seen this state before, reuse its node:
-        if state_key in AI_M_UCT.transposition_table:
-            root = AI_M_UCT.transposition_table[state_key]
+        root = self.reuse.take(map_, team_color)
+        if root is not None:
             return root
 
-        # Otherwise, create a brand-new node
+        if AI_M_UCT.COMPACT_STATE:
+            map_ = CompactMap.from_map(map_)
         root = MGameTree()
         root.board = map_.create_deep_clone()
+        root.entry = self.table.lookup(self.get_state_hash(map_), 0)
 
         # Expand immediate children (all possible next actions)
         all_actions = []
@@ -74,17 +89,24 @@ class AI_M_UCT(Player):
             all_actions.extend(unit_actions)
 
         for action in all_actions:
-            child = MGameTree()
-            child.board = map_.create_deep_clone()
-            child.act = action
-            child.depth = 1
-            child.board.execute_action(action)
-            root.next.append(child)
-
-        # Store in transposition table
-        AI_M_UCT.transposition_table[state_key] = root
+            root.next.append(self.make_child(map_, action, 1))
         return root
 
+    def make_child(self, board, action, depth, new_turn=False):
+        """
+        Node for the state after action on board. Its statistics are the transposition
+        table entry of that state, so a state reached by several paths shares them.
+        """
+        child = MGameTree()
+        child.board = board.create_deep_clone()
+        if new_turn:
+            child.board.inc_turn_count()
+        child.board.execute_action(action)
+        child.act = action
+        child.depth = depth
+        child.entry = self.table.lookup(self.get_state_hash(child.board), depth)
+        return child
+
     def search(self, node, team_color):
         """
         Perform one UCT search iteration starting at 'node'.
@@ -99,24 +121,18 @@ class AI_M_UCT(Player):
         if len(node.next) == 0:
             return
 
-        # 1. Select the best child by UCT
-        max_id = 0
-        max_ucb = -1
-        for j, child in enumerate(node.next):
-            tmp_ucb = self.evaluate_uct(child)
-            if tmp_ucb == 100:  # Unvisited child
-                max_ucb = tmp_ucb
-                max_id = j
-                break
-            if tmp_ucb > max_ucb:
-                max_ucb = tmp_ucb
-                max_id = j
+        # 1. Select the best child by UCT (statistics from the table, priors from the nodes)
+        priors = None
+        if AI_M_UCT.SELECTION.USES_PRIOR:
+            priors = [child.prior for child in node.next]
+        max_id = AI_M_UCT.SELECTION.select_from([child.entry for child in node.next],
+                                                AI_M_UCT.total_simulations, priors)
 
         best_child = node.next[max_id]
 
         # 2. Expand if child is heavily simulated (>= threshold)
         #    i.e. if child has enough visits, we expand or go deeper.
-        if best_child.simnum > AI_M_UCT.SIM_THRESHOLD:
+        if best_child.entry.simnum > AI_M_UCT.SIM_THRESHOLD:
             # If not already expanded, do so
             if len(best_child.next) == 0:
                 # Expand from best_child
@@ -131,33 +147,31 @@ class AI_M_UCT(Player):
                 self.search(best_child, team_color)
 
                 # Update best_child stats
-                best_child.simnum += 1
                 # We pick the best child from best_child’s children for backprop
-                deeper_best = max(best_child.next, key=lambda x: x.last_score) if best_child.next else None
-                if deeper_best:
-                    best_child.last_score = deeper_best.last_score
-                    best_child.total_score += best_child.last_score
-                    best_child.housyuu = best_child.total_score / best_child.simnum
+                deeper_best = max(best_child.next, key=lambda x: x.last_score)
+                best_child.last_score = deeper_best.last_score
+                self.table.update(best_child.entry, best_child.last_score)
 
                 AI_M_UCT.last_id = max_id
 
         else:
             # 3. Otherwise, do a random playout
-            result_state = self.random_simulation(best_child.board, team_color)
+            if AI_M_UCT.COMPILED_ROLLOUT:
+                score = RolloutKernel.rollout_value(best_child.board, team_color)
+            else:
+                result_state = self.random_simulation(best_child.board, team_color)
+                score = self.evaluate_state_value(result_state, team_color)
 
-            best_child.simnum += 1
-            score = self.evaluate_state_value(result_state, team_color)
             best_child.last_score = score
-            best_child.total_score += score
-            best_child.housyuu = best_child.total_score / best_child.simnum
+            self.table.update(best_child.entry, score)
 
             AI_M_UCT.last_id = max_id
 
     def develop(self, node, team_color):
         """
         Expand `node` by generating all child states from current board `node.board`
-        for the specified team_color. We also store newly expanded children into the
-        transposition table if not already present.
+        for the specified team_color. Children of states already in the transposition
+        table start from the statistics stored there.
         """
         all_actions = []
         all_units = node.board.get_units_list(team_color, False, True, False)
@@ -166,32 +180,11 @@ class AI_M_UCT(Player):
             unit_actions = MTools.get_unit_actions(unit, node.board)
             all_actions.extend(unit_actions)
 
+        # If no units can move, we might need to increment turn_count,
+        # but that might be handled in your environment. We'll keep your logic:
+        new_turn = len(node.board.get_units_list(team_color, True, False, False)) == 0
         for action in all_actions:
-            # Check if this action leads to a known state
-            child_board = node.board.create_deep_clone()
-
-            # If no units can move, we might need to increment turn_count,
-            # but that might be handled in your environment. We'll keep your logic:
-            if len(node.board.get_units_list(team_color, True, False, False)) == 0:
-                child_board.inc_turn_count()
-
-            child_board.execute_action(action)
-
-            # Compute the state hash & see if it already exists
-            state_key = self.get_state_hash(child_board)
-            if state_key in AI_M_UCT.transposition_table:
-                # Reuse the existing node
-                child_node = AI_M_UCT.transposition_table[state_key]
-            else:
-                # Create a brand new node
-                child_node = MGameTree()
-                child_node.board = child_board
-                child_node.depth = node.depth + 1
-                # Insert into transposition table
-                AI_M_UCT.transposition_table[state_key] = child_node
-
-            child_node.act = action
-            node.next.append(child_node)
+            node.next.append(self.make_child(node.board, action, node.depth + 1, new_turn))
 
     def random_simulation(self, map_, team_color):
         """
@@ -264,22 +257,12 @@ class AI_M_UCT(Player):
         return_id = 0
 
         for i, return_node in enumerate(root.next):
-            if return_node.housyuu > max_rate:
-                max_rate = return_node.housyuu
+            if return_node.entry.mean() > max_rate:
+                max_rate = return_node.entry.mean()
                 return_id = i
 
         return root.next[return_id].act
 
-    def evaluate_uct(self, node):
-        """
-        Classic UCB formula.
-        If node is unvisited (simnum=0), return a big sentinel (e.g., 100).
-        """
-        if node.simnum == 0:
-            return 100.0
-        return (node.housyuu
-                + AI_M_UCT.UCB_CONST * math.sqrt(math.log(AI_M_UCT.total_simulations) / node.simnum))
-
     def evaluate_state_value(self, map_, team_color):
         """
         Evaluate a game state from the perspective of `team_color`.
@@ -313,39 +296,10 @@ class AI_M_UCT(Player):
     def get_enemy_color(team_color):
         return 0 if team_color == 1 else 1
 
-    # ---------------------------------------------------------------------
-    # NEW: A simple state hashing method
-    # ---------------------------------------------------------------------
     def get_state_hash(self, map_):
         """
-        Returns a string or integer that (mostly) uniquely identifies the map state.
-        We'll do a straightforward approach:
-          - Gather info about each unit: (team, type, x, y, HP, actionFinished)
-          - Sort by unit ID (or positions) to get a canonical ordering
-          - Include turn_count if relevant
-        For large boards or if performance is critical, a Zobrist hash is recommended.
+        Returns an integer that (mostly) uniquely identifies the map state:
+        the 64-bit Zobrist key that Map maintains incrementally. It covers each
+        unit's (team, type, x, y, HP, actionFinished) and the turn count.
         """
-
-        # You can keep it minimal or as robust as you need
-        # Example: create a list of tuples
-        data = []
-        for unit in map_.get_units():
-            if unit is None:
-                continue
-            # You might also incorporate the unit's base type or Mark
-            data.append((
-                unit.get_team_color(),
-                unit.get_name(),          # or the numeric spec ID
-                unit.get_x_pos(),
-                unit.get_y_pos(),
-                unit.get_HP(),
-                unit.is_action_finished()
-            ))
-
-        # Sort the list so that different permutations of the same positions produce the same key
-        data.sort(key=lambda x: (x[0], x[1], x[2], x[3]))
-        turn_cnt = map_.get_turn_count()
-
-        # Then turn that list + turn count into a hashable string
-        # Alternatively, you could do a tuple of (turn_cnt, tuple_of_data) and rely on Python's built-in hashing.
-        return str(turn_cnt) + "|" + str(data)
+        return map_.get_zobrist_key()
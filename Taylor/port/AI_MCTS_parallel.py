@@ -0,0 +1,107 @@
+import multiprocessing as mp
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from AI_MCTS import AI_M_UCT
+from RolloutKernel import RolloutKernel
+from SearchBudget import SearchBudget
+
+
+def _root_search(args):
+    """Worker: run an independent M-UCT search and return (simnum, total_score) of every root child"""
+    map_, team_color, seed, max_sim, time_limit_ms = args
+    random.seed(seed)
+    budget = SearchBudget()
+    budget.start(True, 1, turn_time_ms=time_limit_ms, max_rollouts=max_sim)
+    searcher = AI_M_UCT()
+    root = searcher.make_root(map_, team_color)
+    AI_M_UCT.total_simulations = 0
+    while not budget.is_exhausted():
+        searcher.search(root, team_color)
+        AI_M_UCT.total_simulations += 1
+        budget.add_rollouts()
+    return [(child.simnum, child.total_score) for child in root.next]
+
+
+def _leaf_playouts(args):
+    """Worker: run several playouts from one board and return the sum of their scores"""
+    board, team_color, seeds = args
+    return sum(RolloutKernel.rollout_value(board, team_color, seed) for seed in seeds)
+
+
+class AI_M_UCT_Parallel(AI_M_UCT):
+    """
+    M-UCT spread over worker processes.
+
+    ROOT mode: every worker builds its own tree from the same position with its own seed,
+    and the visit counts and total scores of the root children are summed before picking
+    the child with the best average, as max_rate_action does.
+    LEAF mode: one tree in this process; each playout is replaced by a batch of
+    RolloutKernel playouts run by the pool, and the leaf scores their mean.
+
+    Worker seeds are drawn from a generator seeded with `seed`, so a given seed replays the
+    same search for the same sequence of positions, as long as MAX_SIM rather than the
+    clock ends each search. Root mode pays one process round trip per move; leaf mode
+    pays one per playout, so it only pays off with slow playouts.
+    """
+    ROOT = "root"
+    LEAF = "leaf"
+
+    LEAF_PLAYOUTS_PER_WORKER = 4  # Playouts per worker for each leaf evaluation in LEAF mode
+
+    def __init__(self, mode=ROOT, workers=None, seed=0):
+        super().__init__()
+        self.mode = mode
+        self.workers = workers or mp.cpu_count()
+        self.seed = seed
+        self.rand_gen = random.Random(seed)
+        self.pool = None  # Created on first use, so registering the player is cheap
+
+    def __del__(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+    def get_name(self):
+        return "M-UCT (" + self.mode + " parallel x" + str(self.workers) + ")"
+
+    def show_parameters(self):
+        return "mode=" + self.mode + " workers=" + str(self.workers) + " seed=" + str(self.seed)
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    def make_action(self, map_, team_color, turn_start, game_start):
+        if self.mode == AI_M_UCT_Parallel.LEAF:
+            return super().make_action(map_, team_color, turn_start, game_start)
+
+        # Root parallelization: merge the root statistics of independent searches
+        self.budget.start(turn_start, len(map_.get_units_list(team_color, False, True, False)),
+                          turn_time_ms=AI_M_UCT.LIMIT_TIME, max_rollouts=AI_M_UCT.MAX_SIM)
+        root = self.make_root(map_, team_color)
+        jobs = [(map_, team_color, self.rand_gen.getrandbits(32), AI_M_UCT.MAX_SIM, self.budget.time_limit_ms)
+                for _ in range(self.workers)]
+        for stats in self.get_pool().map(_root_search, jobs):
+            for child, (simnum, total_score) in zip(root.next, stats):
+                child.simnum += simnum
+                child.total_score += total_score
+
+        for child in root.next:
+            if child.simnum > 0:
+                child.housyuu = child.total_score / child.simnum
+        AI_M_UCT.total_simulations = sum(child.simnum for child in root.next)
+        self.budget.stop()
+
+        return self.max_rate_action(root)
+
+    def playout(self, board, team_color):
+        if self.mode != AI_M_UCT_Parallel.LEAF:
+            return super().playout(board, team_color)
+
+        jobs = []
+        for _ in range(self.workers):
+            seeds = [self.rand_gen.getrandbits(31) for _ in range(AI_M_UCT_Parallel.LEAF_PLAYOUTS_PER_WORKER)]
+            jobs.append((board, team_color, seeds))
+        total = sum(self.get_pool().map(_leaf_playouts, jobs))
+        return total / (self.workers * AI_M_UCT_Parallel.LEAF_PLAYOUTS_PER_WORKER)
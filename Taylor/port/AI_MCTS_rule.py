@@ -1,10 +1,11 @@
-import time
-import math
 import random
 
 from MGameTree import MGameTree
 from MTools import MTools
 from Player import Player
+from SearchBudget import SearchBudget
+from SelectionPolicy import UCB1
+from TreeReuse import TreeReuse
 from AiTools import AiTools
 
 
@@ -13,6 +14,7 @@ class AI_M_UCT(Player):
     MAX_SIM = 200  # Number of simulations per action
     SIM_THRESHOLD = 10  # Threshold for expanding child nodes during tree search
     UCB_CONST = 0.15  # Constant for UCB value calculation
+    SELECTION = UCB1(UCB_CONST)  # Child selection policy (UCB1, UCB1Tuned or PUCT) with its constant
 
     # Debug variables
     max_depth = 0
@@ -24,8 +26,8 @@ class AI_M_UCT(Player):
     LIMIT_TIME = 9700  # Time per turn in milliseconds
 
     def __init__(self):
-        self.stopwatch = time.time()
-        self.time_left = AI_M_UCT.LIMIT_TIME
+        self.budget = SearchBudget()
+        self.reuse = TreeReuse()
 
     def get_name(self):
         return "M-UCT (Rule-Based Rollout)"
@@ -34,15 +36,24 @@ class AI_M_UCT(Player):
         return ""
 
     def make_action(self, map_, team_color, turn_start, game_start):
-        # Create root node
-        root = self.make_root(map_, team_color)
-        AI_M_UCT.total_simulations = 0
+        self.budget.start(turn_start, len(map_.get_units_list(team_color, False, True, False)),
+                          turn_time_ms=AI_M_UCT.LIMIT_TIME, max_rollouts=AI_M_UCT.MAX_SIM)
 
-        for _ in range(AI_M_UCT.MAX_SIM):
+        # Continue from the subtree of the previous action if possible, else create a root node
+        root = self.reuse.take(map_, team_color)
+        if root is None:
+            root = self.make_root(map_, team_color)
+        AI_M_UCT.total_simulations = sum(child.simnum for child in root.next)
+
+        while not self.budget.is_exhausted():
             self.search(root, team_color)
             AI_M_UCT.total_simulations += 1
+            self.budget.add_rollouts()
+        self.budget.stop()
 
-        return self.max_rate_action(root)
+        action = self.max_rate_action(root)
+        self.reuse.keep(root, action, map_, team_color)
+        return action
 
     @staticmethod
     def make_root(map_, team_color):
@@ -80,16 +91,7 @@ class AI_M_UCT(Player):
             return
 
         # 2) Select child with the best UCT
-        max_id, max_ucb = 0, -1
-        for j, child in enumerate(node.next):
-            ucb_value = self.evaluate_uct(child)
-            if ucb_value == 100:
-                max_ucb = ucb_value
-                max_id = j
-                break
-            if ucb_value > max_ucb:
-                max_ucb = ucb_value
-                max_id = j
+        max_id = AI_M_UCT.SELECTION.select_from(node.next, AI_M_UCT.total_simulations)
 
         selected_child = node.next[max_id]
 
@@ -112,6 +114,7 @@ class AI_M_UCT(Player):
                 if best_child:
                     selected_child.last_score = best_child.last_score
                     selected_child.total_score += selected_child.last_score
+                    selected_child.sq_score += selected_child.last_score * selected_child.last_score
                     selected_child.housyuu = selected_child.total_score / selected_child.simnum
                 AI_M_UCT.last_id = max_id
 
@@ -121,6 +124,7 @@ class AI_M_UCT(Player):
             selected_child.simnum += 1
             selected_child.last_score = self.evaluate_state_value(result_map, team_color)
             selected_child.total_score += selected_child.last_score
+            selected_child.sq_score += selected_child.last_score * selected_child.last_score
             selected_child.housyuu = selected_child.total_score / selected_child.simnum
             AI_M_UCT.last_id = max_id
 
@@ -155,16 +159,6 @@ class AI_M_UCT(Player):
             child.board.execute_action(action)
             node.next.append(child)
 
-    @staticmethod
-    def evaluate_uct(node):
-        # If we never tried this child, return a large constant
-        if node.simnum == 0:
-            return 100
-        # UCT formula
-        return node.housyuu + AI_M_UCT.UCB_CONST * math.sqrt(
-            math.log(AI_M_UCT.total_simulations) / node.simnum
-        )
-
     def rule_based_simulation(self, map_, team_color):
         """
         A simple rule-based simulation:
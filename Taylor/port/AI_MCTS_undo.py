@@ -1,9 +1,10 @@
-import time
-import math
 import random
 
 from Player import Player
-from MGameTree import MGameTree
+from SearchBudget import SearchBudget
+from SelectionPolicy import UCB1
+from TreeReuse import TreeReuse
+from MGameTreeStore import MGameTreeStore
 from MTools import MTools
 from Action import Action
 from Consts import Consts
@@ -14,6 +15,7 @@ class AI_M_UCT(Player):
     MAX_SIM = 200       # Number of simulations per action
     SIM_THRESHOLD = 10  # Threshold for expanding child nodes
     UCB_CONST = 0.15    # UCB exploration constant
+    SELECTION = UCB1(UCB_CONST)  # Child selection policy (UCB1, UCB1Tuned or PUCT) with its constant
 
     # Debug variables
     max_depth = 0
@@ -24,8 +26,8 @@ class AI_M_UCT(Player):
     LIMIT_TIME = 9700  # Time per turn in milliseconds
 
     def __init__(self):
-        self.stopwatch = time.time()
-        self.time_left = AI_M_UCT.LIMIT_TIME
+        self.budget = SearchBudget()
+        self.reuse = TreeReuse()
 
     def get_name(self):
         return "M-UCT"
@@ -37,76 +39,82 @@ class AI_M_UCT(Player):
         """
         The main entry point for deciding which action to make.
         """
-        # 1. Create the root node
-        root = MGameTree()
-        root.act = None
-        root.depth = 0
-        root.simnum = 0
-        root.total_score = 0.0
-        root.last_score = 0.0
-        root.housyuu = 0.0
-        root.next = []
-
-        # 2. Gather all possible actions from the current map/team in-place
+        self.budget.start(turn_start, len(map_.get_units_list(team_color, False, True, False)),
+                          turn_time_ms=AI_M_UCT.LIMIT_TIME, max_rollouts=AI_M_UCT.MAX_SIM)
+
+        # 1. Continue from the subtree of the previous action if possible, else create the tree
+        tree = self.reuse.take(map_, team_color)
+        if tree is None:
+            tree = self.make_tree(map_, team_color)
+
+        # 2. Run simulations. Undo logs do not cover the turn changes inside the search
+        # (enable_units_action), so the action flags are restored after each iteration.
+        finished_flags = self.get_finished_flags(map_)
+        AI_M_UCT.total_simulations = sum(tree.simnum[child] for child in tree.children(0))
+        while not self.budget.is_exhausted():
+            self.search(tree, 0, map_, team_color)
+            self.set_finished_flags(map_, finished_flags)
+            AI_M_UCT.total_simulations += 1
+            self.budget.add_rollouts()
+        self.budget.stop()
+
+        # 3. Select the best action
+        best = self.max_rate_child(tree)
+        action = tree.get_action(best)
+        if tree.is_expanded(best):
+            board = map_.create_deep_clone()
+            board.execute_action(action)
+            self.reuse.keep_node(tree.subtree(best), board, team_color)
+        else:
+            self.reuse.keep_node(None, None, team_color)
+        return action
+
+    @staticmethod
+    def make_tree(map_, team_color):
+        """
+        Tree whose root has one child per action of team_color on map_.
+        """
+        tree = MGameTreeStore()
+
+        # Gather all possible actions from the current map/team in-place
         all_actions = []
         all_units = map_.get_units_list(team_color, False, True, False)  # all movable units
         for unit in all_units:
             unit_actions = MTools.get_unit_actions(unit, map_)
             all_actions.extend(unit_actions)
 
-        # 3. Create one child node per action (no deep clone, just store the action)
-        for action in all_actions:
-            child = MGameTree()
-            child.act = action
-            child.depth = 1
-            root.next.append(child)
-
-        # 4. Run simulations
-        AI_M_UCT.total_simulations = 0
-        for _ in range(AI_M_UCT.MAX_SIM):
-            self.search(root, map_, team_color)
-            AI_M_UCT.total_simulations += 1
-
-        # 5. Select the best action
-        return self.max_rate_action(root)
+        # Create one child node per action (no deep clone, just store the action)
+        tree.add_children(0, all_actions)
+        return tree
 
-    def search(self, node, map_, team_color):
+    def search(self, tree, node, map_, team_color):
         """
         MCTS search step: selection -> expansion -> simulation/rollout -> backprop.
-        node: current tree node
+        tree: MGameTreeStore being searched
+        node: index of the current tree node
         map_: current board state (in place)
         team_color: whose move it is from node's perspective
         """
         if AI_M_UCT.total_simulations == 0:
             AI_M_UCT.max_depth = 0
-        if node.depth > AI_M_UCT.max_depth:
-            AI_M_UCT.max_depth = node.depth
+        if tree.depth[node] > AI_M_UCT.max_depth:
+            AI_M_UCT.max_depth = tree.depth[node]
 
         # If no children, no moves available
-        if len(node.next) == 0:
+        if not tree.is_expanded(node):
             return
 
         # Selection: pick child with max UCT
-        max_id, max_ucb = 0, -99999
-        for j, child in enumerate(node.next):
-            tmp_ucb = self.evaluate_uct(child)
-            if tmp_ucb == 100:
-                # Found unvisited child, pick it immediately
-                max_ucb = tmp_ucb
-                max_id = j
-                break
-            if tmp_ucb > max_ucb:
-                max_ucb = tmp_ucb
-                max_id = j
+        selected_child = tree.select_child(node, AI_M_UCT.SELECTION, AI_M_UCT.total_simulations)
+        selected_action = tree.get_action(selected_child)
 
         # Expand if needed
-        selected_child = node.next[max_id]
-        if selected_child.simnum > AI_M_UCT.SIM_THRESHOLD and len(selected_child.next) == 0:
+        if tree.simnum[selected_child] > AI_M_UCT.SIM_THRESHOLD and not tree.is_expanded(selected_child):
             # Expand
             # We must figure out who is to move in that child's position
             # The child action is from 'team_color', after applying it, the next mover is either 'team_color' or the enemy
             # depending on whether the same side can still move or not.
-            undo_log = map_.execute_action_inplace(selected_child.act, team_color)
+            undo_log = map_.execute_action_inplace(selected_action, team_color)
             next_color = self.determine_next_color(map_, team_color)
 
             # Now gather all possible actions for the next_color
@@ -116,43 +124,31 @@ class AI_M_UCT(Player):
                 actions.extend(MTools.get_unit_actions(u, map_))
 
             # Create children
-            for act in actions:
-                c = MGameTree()
-                c.act = act
-                c.depth = selected_child.depth + 1
-                selected_child.next.append(c)
+            tree.add_children(selected_child, actions)
 
             # Revert the action
             map_.undo_action_inplace(undo_log)
 
         # Now either we descend or we rollout
-        if len(selected_child.next) > 0:
+        if tree.is_expanded(selected_child):
             # We have children, so descend deeper
-            undo_log = map_.execute_action_inplace(selected_child.act, team_color)
+            undo_log = map_.execute_action_inplace(selected_action, team_color)
             next_color = self.determine_next_color(map_, team_color)
-            self.search(selected_child, map_, next_color)
+            self.search(tree, selected_child, map_, next_color)
             # Backprop
-            selected_child.simnum += 1
             # We pick the best child's last_score to feed back
-            if selected_child.next:
-                best_child = max(selected_child.next, key=lambda x: x.last_score)
-                selected_child.last_score = best_child.last_score
-                selected_child.total_score += selected_child.last_score
-                selected_child.housyuu = selected_child.total_score / selected_child.simnum
+            best_child = max(tree.children(selected_child), key=lambda c: tree.last_score[c])
+            tree.update(selected_child, tree.last_score[best_child])
             map_.undo_action_inplace(undo_log)
-            AI_M_UCT.last_id = max_id
         else:
             # Rollout
-            undo_log = map_.execute_action_inplace(selected_child.act, team_color)
+            undo_log = map_.execute_action_inplace(selected_action, team_color)
             next_color = self.determine_next_color(map_, team_color)
             value = self.random_simulation(map_, next_color, team_color)  # random rollout
             # Backprop
-            selected_child.simnum += 1
-            selected_child.last_score = value
-            selected_child.total_score += value
-            selected_child.housyuu = selected_child.total_score / selected_child.simnum
+            tree.update(selected_child, value)
             map_.undo_action_inplace(undo_log)
-            AI_M_UCT.last_id = max_id
+        AI_M_UCT.last_id = selected_child - tree.first_child[node]
 
     def random_simulation(self, map_, sim_color, my_team_color):
         """
@@ -241,29 +237,27 @@ class AI_M_UCT(Player):
         return current_color
 
     @staticmethod
-    def max_rate_action(root):
-        """
-        Among root's children, pick the action with the highest average return (housyuu).
-        """
-        max_rate = -9999
-        return_id = 0
-        for i, node in enumerate(root.next):
-            if node.housyuu > max_rate:
-                max_rate = node.housyuu
-                return_id = i
-        return root.next[return_id].act
+    def get_finished_flags(map_):
+        return [unit is not None and unit.is_action_finished() for unit in map_.get_units()]
 
     @staticmethod
-    def evaluate_uct(node):
+    def set_finished_flags(map_, finished_flags):
+        for unit, finished in zip(map_.get_units(), finished_flags):
+            if unit is not None:
+                map_.set_unit_action_finished(unit, finished)
+
+    @staticmethod
+    def max_rate_child(tree):
         """
-        Standard UCB1 formula + hack for unvisited nodes
+        Among the root's children, pick the one with the highest average return (housyuu).
         """
-        if node.simnum == 0:
-            return 100  # prioritize unvisited nodes
-        else:
-            return node.housyuu + AI_M_UCT.UCB_CONST * math.sqrt(
-                math.log(AI_M_UCT.total_simulations) / node.simnum
-            )
+        max_rate = -9999
+        return_node = tree.first_child[0]
+        for node in tree.children(0):
+            if tree.housyuu(node) > max_rate:
+                max_rate = tree.housyuu(node)
+                return_node = node
+        return return_node
 
     @staticmethod
     def evaluate_state_value(map_, team_color):
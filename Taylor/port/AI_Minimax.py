@@ -1,5 +1,11 @@
+from array import array
+
+from CompactMap import CompactMap
+from EvalCache import EvalCache
 from MTools import MTools
 from Player import Player
+from SearchBudget import SearchBudget
+from StreamingEvaluator import StreamingEvaluator
 import time
 from MapUtils import MapUtils
 import numpy as np
@@ -21,9 +27,15 @@ class AI_Minimax(Player):
     MAX_UNITS = 6
     FAST_MATRIX_FORMAT = True
     MASK_ADJACENCY = False
+    COMPACT_STATE = True  # Search on a CompactMap copy of the board
+    LIMIT_TIME = 9700  # Time per turn in milliseconds
+    MAX_NODES = -1     # States generated per action (negative: no limit)
+    EVAL_BATCH_SIZE = 256  # Leaves per inference call of the streaming evaluator
+    INFERENCE_BACKEND = 'function'  # NNModel.inference_backend: 'predict', 'function' or 'tflite' (see NNModel.py to convert)
+    EVAL_CACHE_SIZE = 200000  # Leaf evaluations kept across decisions
 
     def __init__(self):
-        self.stopwatch = time.time()
+        self.budget = SearchBudget()
         # self.model = GCNModel("plains_unit-list/GCN_fast_b128_e30.keras")
         # self.model = GCNModel("plains_unit-list/GCN_fast_b128_e50.keras")
         self.model = GCNModel("plains_unit-list/GCN_fast_b128_e75.keras")
@@ -36,6 +48,9 @@ class AI_Minimax(Player):
         # self.model = GCNBasicModel("plains_unit-list/GCNBasic_M_b128_e20.keras")
         # self.model = GCNBasicModel("plains_unit-list/GCNBasic_slowM_b128_e50.keras")
         self.model.load_model()
+        self.model.inference_backend = self.INFERENCE_BACKEND
+        self.evaluator = StreamingEvaluator(self.model, self.MAX_UNITS, self.FAST_MATRIX_FORMAT, self.MASK_ADJACENCY, self.EVAL_BATCH_SIZE)
+        self.eval_cache = EvalCache(self.EVAL_CACHE_SIZE)
         # self.timing_stats = {
         #     'data_prep': [],
         #     'tensorization': [],
@@ -58,120 +73,112 @@ class AI_Minimax(Player):
         # raise Exception("Diagnostic batch complete")
 
 
+        self.budget.start(turn_start, len(map_.get_units_list(team_color, False, True, False)),
+                          turn_time_ms=self.LIMIT_TIME, max_nodes=self.MAX_NODES)
+
+        if self.COMPACT_STATE:
+            map_ = CompactMap.from_map(map_)
+
         # Get the best sequence of moves
         if self.MAX_DEPTH == 1:
             best_sequence = self.depth1minimax(map_, team_color)
         else:
             best_sequence = self.depth2minimax(map_, team_color)
+        self.budget.stop()
         
         # Return the first action from the best sequence
         return best_sequence
     
     def depth1minimax(self, map_, team_color):
-        # Get all valid actions for the current state
-        valid_actions = self.get_valid_actions_for_state(map_, team_color)
-        states = []
-        
-        for action in valid_actions:
-            # Create new state after first action
-            state = map_.create_deep_clone()
-            state.execute_action(action)
-            states.append((action, state))
-
-        # states labeled in range [-1,1] 
-        evals = self.batch_eval(states)
-        if team_color == 1:
-            evals = [-1 * x for x in evals] # invert evals for blue team
-
-        # choose best action
-        return valid_actions[np.argmax(evals)]
+        return self.minimax(map_, team_color, 1)
 
     def depth2minimax(self, map_, team_color):
+        return self.minimax(map_, team_color, 2)
+
+    def minimax(self, map_, team_color, depth):
         # Start with first unit's possible actions
         first_actions = self.get_valid_actions_for_state(map_, team_color)
-        final_states = []
-        
-        for first_action in first_actions:
-            # Create new state after first action
-            first_state = map_.create_deep_clone()
-            first_state.execute_action(first_action)
-            
-            # Get valid actions for remaining units in the new state
-            second_actions = self.get_valid_actions_for_state(first_state, team_color)
-
-            if len(second_actions) == 0:
-                final_states.append((first_action, first_state))
-
-            # Try each possible second action
-            for second_action in second_actions:
-                # Create final state after both actions
-                final_state = first_state.create_deep_clone()
-                final_state.execute_action(second_action)
-                final_states.append((first_action, final_state))
-        
-        # states labeled in range [-1,1] 
-        evals = self.batch_eval(final_states)
-        if team_color == 1:
-            evals = [-1 * x for x in evals] # invert evals for blue team
-        
-        # create list of evals for each first action, choosing the lowest one for each first action
-        best_evals = [999]
-        curr_state = final_states[0][0]
-        for i in range(len(final_states)):
-            if final_states[i][0] != curr_state:
-                best_evals.append(999)
-                curr_state = final_states[i][0]
-            if evals[i] < best_evals[len(best_evals)-1]:
-                best_evals[len(best_evals)-1] = evals[i]
-
-        # print('calculated turn')
+        leaves = self.generate_leaves(map_, team_color, first_actions, depth)
+        map_matrix = self.to_map_matrix(map_)
+        terrain_key = self.to_terrain_key(map_matrix)
+
+        # Lowest eval over the leaves of each first action, reduced batch by batch as they are evaluated.
+        # States are labeled in range [-1,1]; first actions left unexpanded by the budget keep inf.
+        best_evals = np.full(len(first_actions), np.inf)
+        for keys, evals in self.eval_cache.evaluate(self.evaluator, leaves, map_matrix, terrain_key):
+            if team_color == 1:
+                evals = -evals  # invert evals for blue team
+            np.minimum.at(best_evals, keys, evals)
+        best_evals[best_evals == np.inf] = -np.inf
 
         # find the best first action
         return first_actions[np.argmax(best_evals)]
-    
-
-    
-    def batch_eval(self, final_states):        
-        # print('batch_eval start')
-        # start_time = time.time()
-
-        data = [[],[],[],[],[],[],[],[],[],[]]
-
-        for state in final_states:
-            map_matrix, unit_list, move = self.to_matrix_ulist(state[1], state[0])
 
-            new_mats = MapUtils.create_data_matrices(unit_list, map_matrix, self.MAX_UNITS, self.FAST_MATRIX_FORMAT, self.MASK_ADJACENCY) 
-            for i in range(len(new_mats)):
-                data[i].append(new_mats[i])
-
-        # print('data extracted. Time taken to create data matrices: ')
+    def generate_leaves(self, map_, team_color, first_actions, depth):
+        """
+        Generator of the leaves as (index of the first action, Zobrist key, unit records),
+        made and unmade on map_. At depth 2 the leaves of a first action are the states after
+        each action of the remaining units (or the state after it, if no unit is left to act).
+        """
+        for index, first_action in enumerate(first_actions):
+            if index > 0 and self.budget.is_exhausted():
+                break  # Out of budget: choose among the first actions expanded so far
+
+            # Make the first action on the map itself, it is undone after its leaves
+            first_log = map_.execute_action_inplace(first_action, team_color)
+            if depth == 1:
+                self.budget.add_nodes()
+                yield index, map_.get_zobrist_key(), self.snapshot_units(map_)
+                map_.undo_action_inplace(first_log)
+                continue
 
+            # Get valid actions for remaining units in the new state
+            second_actions = self.get_valid_actions_for_state(map_, team_color)
+            self.budget.add_nodes(1 + len(second_actions))
 
-        tensors = self.model.tensorize_data(data)
-        input = self.model.select_data(tensors)
+            if len(second_actions) == 0:
+                yield index, map_.get_zobrist_key(), self.snapshot_units(map_)
 
-        # print('data tensorized')
-        # print([input[i].shape for i in range(len(input))])
+            # Try each possible second action
+            for second_action in second_actions:
+                second_log = map_.execute_action_inplace(second_action, team_color)
+                yield index, map_.get_zobrist_key(), self.snapshot_units(map_)
+                map_.undo_action_inplace(second_log)
 
-        continuous_preds, pred_labels = self.model.perform_inference(input)
-        # print('batch_eval end. Time taken to perform inference: ', time.time() - start_time)
-        return continuous_preds
-        
+            map_.undo_action_inplace(first_log)
 
     def to_matrix_ulist(self, map, move):
+        return (self.to_map_matrix(map), StreamingEvaluator.to_unit_list(self.snapshot_units(map)), str(move))
+
+    @staticmethod
+    def to_map_matrix(map):
         # clone map matrix (map.map_field_type)
         map_matrix = []
         for row in map.map_field_type:
             map_matrix.append(row.copy())
-        # create UnitData objects from units in map
-        unit_list = []
+        return map_matrix
+
+    @staticmethod
+    def to_terrain_key(map_matrix):
+        # the part of the eval cache key that identifies the terrain
+        return hash(tuple(tuple(row) for row in map_matrix))
+
+    @staticmethod
+    def snapshot_units(map):
+        """
+        Unit records of map in the CompactMap layout (x, y, type, team, HP, finished, alive
+        per unit id), the only part of a leaf state the features need.
+        For a CompactMap this is a single copy of its unit records.
+        """
+        if isinstance(map, CompactMap):
+            return map.state[CompactMap.UNIT_BASE:map.grid_base]
+        records = array('h', [0]) * (len(map.units) * CompactMap.UNIT_FIELDS)
         for unit in map.units:
             if unit is not None:
-                unit_str = unit.spec.get_spec_name()
-                type = ConstsData.unitNames.index(unit_str)
-                moved = 1 if unit.action_finished else 0
-                unit_list.append(UnitData(unit.x_pos, unit.y_pos, type, unit.team_color, unit.HP, moved))
-        return (map_matrix, unit_list, str(move))
+                base = unit.get_ID() * CompactMap.UNIT_FIELDS
+                records[base:base + CompactMap.UNIT_FIELDS] = array('h', [unit.x_pos, unit.y_pos, unit.get_type_of_unit(), unit.team_color,
+                                                                          unit.HP, 1 if unit.action_finished else 0, 1])
+        return records
     
     
 
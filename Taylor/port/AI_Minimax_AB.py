@@ -0,0 +1,170 @@
+import math
+
+from AI_Minimax import AI_Minimax
+from Action import Action
+from CompactMap import CompactMap
+from Consts import Consts
+from DamageCalculator import DamageCalculator
+
+
+class AI_Minimax_AB(AI_Minimax):
+    """
+    Alpha-beta search over unit-actions with iterative deepening, evaluated by the NN of AI_Minimax.
+
+    One ply is one unit-action. Red maximizes and blue minimizes the model's output; when the
+    side to move has no unit left to act, the phase changes as in GameManager.change_phase
+    (Map.change_phase_inplace). Annihilation is scored -1/1 without the model.
+
+    Leaves are still evaluated in batches. A deepening pass runs alpha-beta with the values it
+    has; a horizon leaf without one gets the value of its parent (evaluated in the previous
+    pass, else 0) as an estimate and is collected. The collected leaves are evaluated in one
+    stream through the eval cache and the pass is run again, until it needs no new leaf.
+    The result is then exact for that depth.
+
+    Actions are ordered attacks first, by expected damage (dealt minus counter-attack), then
+    moves; at the root, by the values of the previous pass. Deepening stops at MAX_DEPTH or
+    when the budget runs out, and an interrupted pass is discarded.
+    """
+    MAX_DEPTH = 4  # Deepest pass, in unit-actions
+
+    def get_name(self):
+        return "Minimax-AB"
+
+    def show_parameters(self):
+        return "MAX_DEPTH=" + str(self.MAX_DEPTH)
+
+    def make_action(self, map_, team_color, turn_start, game_start):
+        self.budget.start(turn_start, len(map_.get_units_list(team_color, False, True, False)),
+                          turn_time_ms=self.LIMIT_TIME, max_nodes=self.MAX_NODES)
+
+        if self.COMPACT_STATE:
+            map_ = CompactMap.from_map(map_)
+        self.map_matrix = self.to_map_matrix(map_)
+        self.terrain_key = self.to_terrain_key(self.map_matrix)
+        self.leaf_values = {}  # Zobrist key -> model output of the leaves evaluated for this action
+
+        actions = self.order_actions(map_, self.get_valid_actions_for_state(map_, team_color))
+        best_action = actions[0]
+        for depth in range(1, self.MAX_DEPTH + 1):
+            values = self.deepening_pass(map_, team_color, actions, depth)
+            if values is None:
+                break  # Out of budget: keep the result of the previous pass
+
+            # Best first for the next pass; the sort is stable, so ties keep their order
+            sign = 1 if team_color == Consts.RED_TEAM else -1
+            order = sorted(range(len(actions)), key=lambda i: -sign * values[i])
+            actions = [actions[i] for i in order]
+            best_action = actions[0]
+            if self.budget.is_exhausted():
+                break
+        self.budget.stop()
+        return best_action
+
+    def deepening_pass(self, map_, team_color, actions, depth):
+        """Values of the root actions searched to depth, or None if the budget ran out (after depth 1)"""
+        while True:
+            self.aborted = False
+            self.can_abort = depth > 1
+            self.missing = {}  # Zobrist key -> unit records of the leaves without a value
+            values = self.search_root(map_, team_color, actions, depth)
+            if self.aborted:
+                return None
+            if not self.missing:
+                return values
+            self.evaluate_missing()
+            if self.can_abort and self.budget.is_exhausted():
+                return None
+
+    def search_root(self, map_, team_color, actions, depth):
+        """Value of each root action; only the best is exact, the others are bounds"""
+        maximizing = team_color == Consts.RED_TEAM
+        alpha = -math.inf
+        beta = math.inf
+        values = []
+        for action in actions:
+            value = self.search_action(map_, team_color, action, depth, alpha, beta, map_.get_zobrist_key())
+            values.append(value)
+            if maximizing:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if self.aborted:
+                break
+        return values
+
+    def search_action(self, map_, side, action, depth, alpha, beta, parent_key):
+        """Play action (changing the phase if side has no unit left to act), search the position and take it back"""
+        undo_log = map_.execute_action_inplace(action, side)
+        phase_log = None
+        next_side = side
+        if len(map_.get_units_list(side, False, True, False)) == 0:
+            phase_log = map_.change_phase_inplace(side)
+            next_side = 1 - side
+
+        value = self.alphabeta(map_, next_side, depth - 1, alpha, beta, parent_key)
+
+        if phase_log is not None:
+            map_.undo_action_inplace(phase_log)
+        map_.undo_action_inplace(undo_log)
+        return value
+
+    def alphabeta(self, map_, side, depth, alpha, beta, parent_key):
+        if map_.get_num_of_alive_color_units(Consts.RED_TEAM) == 0:
+            return -1.0
+        if map_.get_num_of_alive_color_units(Consts.BLUE_TEAM) == 0:
+            return 1.0
+        if depth == 0 or map_.get_turn_count() >= map_.get_turn_limit():
+            return self.leaf_value(map_, parent_key)
+        if self.can_abort and self.budget.is_exhausted():
+            self.aborted = True
+            return 0.0
+
+        actions = self.order_actions(map_, self.get_valid_actions_for_state(map_, side))
+        if len(actions) == 0:
+            return self.leaf_value(map_, parent_key)
+        self.budget.add_nodes(len(actions))
+        key = map_.get_zobrist_key()
+        maximizing = side == Consts.RED_TEAM
+        best = -math.inf if maximizing else math.inf
+        for action in actions:
+            value = self.search_action(map_, side, action, depth, alpha, beta, key)
+            if self.aborted:
+                return 0.0
+            if maximizing:
+                best = max(best, value)
+                alpha = max(alpha, value)
+            else:
+                best = min(best, value)
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+        return best
+
+    def leaf_value(self, map_, parent_key):
+        """Model output of a horizon state, or an estimate if it has not been evaluated yet"""
+        key = map_.get_zobrist_key()
+        value = self.leaf_values.get(key)
+        if value is None:
+            value = self.eval_cache.get((self.terrain_key, key))
+            if value is None:
+                self.missing[key] = self.snapshot_units(map_)
+                return self.leaf_values.get(parent_key, 0.0)
+            self.leaf_values[key] = value
+        return value
+
+    def evaluate_missing(self):
+        keys = list(self.missing)
+        leaves = ((i, key, self.missing[key]) for i, key in enumerate(keys))
+        for positions, values in self.eval_cache.evaluate(self.evaluator, leaves, self.map_matrix, self.terrain_key):
+            for position, value in zip(positions, values):
+                self.leaf_values[keys[position]] = value
+
+    @staticmethod
+    def order_actions(map_, actions):
+        """Attacks first, by damage dealt minus counter-attack damage taken, then moves in generation order"""
+        def key(action):
+            if action.action_type == Action.ACTIONTYPE_MOVEANDATTACK:
+                damages = DamageCalculator.calculate_damages(map_, action)
+                return 1, damages[0] - damages[1]
+            return 0, 0
+        return sorted(actions, key=key, reverse=True)
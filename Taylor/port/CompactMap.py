@@ -0,0 +1,446 @@
+from array import array
+
+from Consts import Consts
+from Map import Map
+from Spec import Spec
+from Unit import Unit
+from Zobrist import Zobrist
+
+
+class CompactUnit:
+    """
+    View of one unit record stored inside a CompactMap state buffer.
+    Exposes the same interface as Unit, but reads and writes the buffer directly,
+    so cloning the map never has to clone unit objects.
+    """
+    __slots__ = ("map", "id", "base", "x_ints")
+
+    def __init__(self, map_, unit_id):
+        self.map = map_
+        self.id = unit_id
+        self.base = CompactMap.UNIT_BASE + unit_id * CompactMap.UNIT_FIELDS
+        self.x_ints = []
+
+    # Attribute-style access kept for code that reads Unit fields directly
+    @property
+    def x_pos(self):
+        return self.map.state[self.base + CompactMap.F_X]
+
+    @property
+    def y_pos(self):
+        return self.map.state[self.base + CompactMap.F_Y]
+
+    @property
+    def HP(self):
+        return self.map.state[self.base + CompactMap.F_HP]
+
+    @property
+    def team_color(self):
+        return self.map.state[self.base + CompactMap.F_TEAM]
+
+    @property
+    def action_finished(self):
+        return self.map.state[self.base + CompactMap.F_FINISHED] == 1
+
+    @property
+    def spec(self):
+        return Spec.specs[self.map.state[self.base + CompactMap.F_TYPE]]
+
+    def get_HP(self):
+        """Get the hit points"""
+        return self.map.state[self.base + CompactMap.F_HP]
+
+    def is_dead(self):
+        """Check if the unit is destroyed (HP is 0 or less)"""
+        return self.map.state[self.base + CompactMap.F_HP] == 0
+
+    def get_x_pos(self):
+        """Get the X position on the map"""
+        return self.map.state[self.base + CompactMap.F_X]
+
+    def get_y_pos(self):
+        """Get the Y position on the map"""
+        return self.map.state[self.base + CompactMap.F_Y]
+
+    def get_type_of_unit(self):
+        """Get the type of the unit"""
+        return self.map.state[self.base + CompactMap.F_TYPE]
+
+    def get_ID(self):
+        """Get the ID of the unit"""
+        return self.id
+
+    def get_team_color(self):
+        """Get the team color of the unit"""
+        return self.map.state[self.base + CompactMap.F_TEAM]
+
+    def get_name(self):
+        """Get the name of the unit"""
+        return self.spec.get_spec_name()
+
+    def get_mark(self):
+        """Get the mark of the unit"""
+        return self.spec.get_spec_mark()
+
+    def get_spec(self):
+        """Get the spec of the unit"""
+        return Spec.specs[self.map.state[self.base + CompactMap.F_TYPE]]
+
+    def get_x_ints(self):
+        """Get the X_ints array"""
+        return self.x_ints
+
+    def get_x_int(self, idx):
+        """Get the value at the specified index of X_ints"""
+        return self.x_ints[idx]
+
+    def is_action_finished(self):
+        """Check if the action is finished"""
+        return self.map.state[self.base + CompactMap.F_FINISHED] == 1
+
+    def set_HP(self, hp):
+        """Set the hit points"""
+        self.map.state[self.base + CompactMap.F_HP] = hp
+
+    def set_pos(self, x, y):
+        """Set the position on the map (does not update the occupancy grid)"""
+        self.map.state[self.base + CompactMap.F_X] = x
+        self.map.state[self.base + CompactMap.F_Y] = y
+
+    def set_x_pos(self, x):
+        """Set the X position on the map"""
+        self.map.state[self.base + CompactMap.F_X] = x
+
+    def set_y_pos(self, y):
+        """Set the Y position on the map"""
+        self.map.state[self.base + CompactMap.F_Y] = y
+
+    def set_x_int(self, idx, value):
+        """Set the value at the specified index of X_ints"""
+        self.x_ints[idx] = value
+
+    def set_x_ints(self, arg_ints):
+        """Set the X_ints array"""
+        self.x_ints = arg_ints
+
+    def init_x_ints(self, length):
+        """Initialize the X_ints array with the specified length"""
+        self.x_ints = [0] * length
+
+    def set_action_finished(self, action_finish_flag):
+        """Set the action finished flag"""
+        self.map.state[self.base + CompactMap.F_FINISHED] = 1 if action_finish_flag else 0
+
+    def raise_HP(self, value):
+        """Increase the hit points by the specified value"""
+        self.map.state[self.base + CompactMap.F_HP] += value
+
+    def reduce_HP(self, value):
+        """Decrease the hit points by the specified value, setting it to 0 if it becomes 0 or less"""
+        idx = self.base + CompactMap.F_HP
+        self.map.state[idx] = max(0, self.map.state[idx] - value)
+
+    def to_string(self):
+        """Convert the unit information to a string for display purposes"""
+        return self.create_deep_clone().to_string()
+
+    def to_short_string(self):
+        """Convert the unit information to a short string for logging purposes"""
+        return f"{self.get_mark()}{self.get_HP()}({self.get_x_pos()}, {self.get_y_pos()})"
+
+    def create_deep_clone(self):
+        """Create a detached Unit holding the current values of this record"""
+        clone = Unit(self.get_x_pos(), self.get_y_pos(), self.id, self.get_team_color(), self.get_HP(),
+                     1 if self.is_action_finished() else 0, self.get_spec())
+        clone.set_x_ints(self.x_ints.copy())
+        return clone
+
+
+class CompactMap(Map):
+    """
+    Alternative Map backend that keeps the whole mutable game state in one flat
+    array('h') buffer:
+
+        [alive_red, alive_blue | unit records ... | occupancy grid ...]
+
+    Each unit record is (x, y, type, team, HP, finished, alive). The occupancy grid
+    holds the id of the unit on each cell (x * y_size + y) or -1 when empty.
+    Terrain is immutable during a game and is shared between clones, so
+    create_deep_clone() is a single buffer copy.
+
+    The public API is the same as Map; units are returned as CompactUnit views.
+    """
+
+    # Header layout
+    H_ALIVE_RED = 0
+    H_ALIVE_BLUE = 1
+    UNIT_BASE = 2
+
+    # Unit record layout
+    F_X = 0
+    F_Y = 1
+    F_TYPE = 2
+    F_TEAM = 3
+    F_HP = 4
+    F_FINISHED = 5
+    F_ALIVE = 6
+    UNIT_FIELDS = 7
+
+    EMPTY = -1
+
+    def __init__(self, map_file_name=None, reversed=False, raw_map_str=None):
+        self.x_size = None
+        self.y_size = None
+        self.map_field_type = None
+        self.max_unit_num = [0, 0]
+        self.turn_count = None
+        self.turn_limit = None
+        self.draw_hp_threshold = None
+        self.map_file_name = map_file_name
+        self.reverse = reversed
+        self.raw_map = raw_map_str
+        self.zobrist_key = 0
+        self.move_table = None
+        self.team_reach = [None, None]
+
+        self.unit_capacity = 0
+        self.grid_base = CompactMap.UNIT_BASE
+        self.state = array('h')
+        self.views = []
+
+        if map_file_name is not None or raw_map_str is not None:
+            self.copy_from_map(Map(map_file_name, reversed, raw_map_str))
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["views"] = [None] * self.unit_capacity
+        return state
+
+    @staticmethod
+    def from_map(map_):
+        """Build a CompactMap holding the same state as an object-based Map"""
+        if isinstance(map_, CompactMap):
+            return map_.create_deep_clone()
+        compact = CompactMap()
+        compact.copy_from_map(map_)
+        return compact
+
+    def copy_from_map(self, map_):
+        """Initialize this map from an object-based Map"""
+        self.x_size = map_.x_size
+        self.y_size = map_.y_size
+        self.map_field_type = map_.map_field_type
+        self.max_unit_num = map_.max_unit_num.copy()
+        self.turn_count = map_.turn_count
+        self.turn_limit = map_.turn_limit
+        self.draw_hp_threshold = map_.draw_hp_threshold
+        self.map_file_name = map_.map_file_name
+        self.reverse = map_.reverse
+        self.raw_map = map_.raw_map
+        self.zobrist_key = Zobrist.turn_key(self.turn_count)
+        self.move_table = map_.move_table
+        self.clear_team_reach()
+
+        self.unit_capacity = len(map_.units)
+        self.grid_base = CompactMap.UNIT_BASE + self.unit_capacity * CompactMap.UNIT_FIELDS
+        self.state = array('h', [0]) * (self.grid_base + self.x_size * self.y_size)
+        for i in range(self.grid_base, len(self.state)):
+            self.state[i] = CompactMap.EMPTY
+        self.views = [None] * self.unit_capacity
+
+        for unit in map_.units:
+            if unit is not None:
+                self.restore_dead_unit(unit)
+
+    def to_map(self):
+        """Convert back to an object-based Map"""
+        new_map = Map()
+        new_map.x_size = self.x_size
+        new_map.y_size = self.y_size
+        new_map.map_field_type = [row[:] for row in self.map_field_type]
+        new_map.map_unit = [[None] * self.y_size for _ in range(self.x_size)]
+        new_map.max_unit_num = self.max_unit_num.copy()
+        new_map.units = [None] * self.unit_capacity
+        new_map.num_of_alive_units = self.num_of_alive_units.copy()
+        new_map.turn_count = self.turn_count
+        new_map.turn_limit = self.turn_limit
+        new_map.draw_hp_threshold = self.draw_hp_threshold
+        new_map.map_file_name = self.map_file_name
+        new_map.reverse = self.reverse
+        new_map.raw_map = self.raw_map
+        new_map.zobrist_key = self.zobrist_key
+        new_map.move_table = self.move_table
+        new_map.team_reach = self.team_reach
+
+        for unit in self.get_units():
+            if unit is None:
+                continue
+            new_unit = unit.create_deep_clone()
+            new_map.map_unit[new_unit.get_x_pos()][new_unit.get_y_pos()] = new_unit
+            new_map.units[new_unit.id] = new_unit
+
+        return new_map
+
+    # ------------------------------------------------------------------
+    # Storage primitives (everything else is inherited from Map)
+    # ------------------------------------------------------------------
+
+    @property
+    def num_of_alive_units(self):
+        return [self.state[CompactMap.H_ALIVE_RED], self.state[CompactMap.H_ALIVE_BLUE]]
+
+    @property
+    def units(self):
+        return self.get_units()
+
+    @property
+    def map_unit(self):
+        return [[self.get_unit_at(x, y) for y in range(self.y_size)] for x in range(self.x_size)]
+
+    def get_num_of_alive_color_units(self, team_color):
+        """Return the number of remaining units of the specified team"""
+        return self.state[CompactMap.H_ALIVE_RED + team_color]
+
+    def is_alive(self, unit_id):
+        return self.state[CompactMap.UNIT_BASE + unit_id * CompactMap.UNIT_FIELDS + CompactMap.F_ALIVE] == 1
+
+    def view(self, unit_id):
+        """Return the (cached) CompactUnit view for a unit id, alive or not"""
+        unit = self.views[unit_id]
+        if unit is None:
+            unit = CompactUnit(self, unit_id)
+            self.views[unit_id] = unit
+        return unit
+
+    def get_units(self):
+        """Get the array containing all units of all teams"""
+        return [self.view(i) if self.is_alive(i) else None for i in range(self.unit_capacity)]
+
+    def get_unit(self, unit_id):
+        """Get the unit specified by the argument (Id), returning None if out of range or destroyed"""
+        if unit_id < 0 or unit_id >= self.unit_capacity or not self.is_alive(unit_id):
+            return None
+        return self.view(unit_id)
+
+    def get_unit_at(self, x, y):
+        """Get the unit at a specific position"""
+        unit_id = self.state[self.grid_base + x * self.y_size + y]
+        if unit_id == CompactMap.EMPTY:
+            return None
+        return self.view(unit_id)
+
+    def get_units_list(self, team_color, including_my_action_finished_units, including_my_movable_units, including_opponent_units):
+        """
+        Return a list of units corresponding to the specified 'including' conditions.
+        Same semantics as Map.get_units_list, scanning the unit records directly.
+        """
+        state = self.state
+        units_list = []
+        base = CompactMap.UNIT_BASE
+        for unit_id in range(self.unit_capacity):
+            if state[base + CompactMap.F_ALIVE]:
+                if state[base + CompactMap.F_TEAM] == team_color:
+                    if state[base + CompactMap.F_FINISHED]:
+                        take = including_my_action_finished_units
+                    else:
+                        take = including_my_movable_units
+                else:
+                    take = including_opponent_units
+                if take:
+                    units_list.append(self.view(unit_id))
+            base += CompactMap.UNIT_FIELDS
+        return units_list
+
+    def add_unit(self, x, y, name, team, HP, action_finished):
+        """Method for generating units"""
+        unit_id = sum(self.num_of_alive_units)
+        self.restore_dead_unit(Unit(x, y, unit_id, team, HP, action_finished, Spec.get_spec(name)))
+
+    def delete_unit(self, dead_unit):
+        """Delete a destroyed unit"""
+        self.toggle_unit_key(dead_unit)
+        self.clear_team_reach()
+        base = CompactMap.UNIT_BASE + dead_unit.id * CompactMap.UNIT_FIELDS
+        self.state[CompactMap.H_ALIVE_RED + self.state[base + CompactMap.F_TEAM]] -= 1
+        self.state[self.grid_base + self.state[base + CompactMap.F_X] * self.y_size + self.state[base + CompactMap.F_Y]] = CompactMap.EMPTY
+        self.state[base + CompactMap.F_ALIVE] = 0
+
+    def change_unit_location(self, x, y, selected_unit):
+        base = CompactMap.UNIT_BASE + selected_unit.id * CompactMap.UNIT_FIELDS
+        temp_x_pos = self.state[base + CompactMap.F_X]
+        temp_y_pos = self.state[base + CompactMap.F_Y]
+        dest = self.grid_base + x * self.y_size + y
+        if self.state[dest] != CompactMap.EMPTY and self.state[dest] != selected_unit.id:
+            print("Map: Bug. Unit attempting to move on top of other unit．")
+        if temp_x_pos == x and temp_y_pos == y:
+            return
+        self.toggle_unit_key(selected_unit)
+        self.clear_team_reach()
+        self.state[dest] = selected_unit.id
+        self.state[self.grid_base + temp_x_pos * self.y_size + temp_y_pos] = CompactMap.EMPTY
+        self.state[base + CompactMap.F_X] = x
+        self.state[base + CompactMap.F_Y] = y
+        self.toggle_unit_key(selected_unit)
+
+    def restore_dead_unit(self, cloned_unit):
+        """
+        Write a unit (any object implementing the Unit interface) into its record
+        and the occupancy grid, marking it alive.
+        """
+        base = CompactMap.UNIT_BASE + cloned_unit.id * CompactMap.UNIT_FIELDS
+        x = cloned_unit.get_x_pos()
+        y = cloned_unit.get_y_pos()
+        team = cloned_unit.get_team_color()
+        self.state[base + CompactMap.F_X] = x
+        self.state[base + CompactMap.F_Y] = y
+        self.state[base + CompactMap.F_TYPE] = cloned_unit.get_type_of_unit()
+        self.state[base + CompactMap.F_TEAM] = team
+        self.state[base + CompactMap.F_HP] = cloned_unit.get_HP()
+        self.state[base + CompactMap.F_FINISHED] = 1 if cloned_unit.is_action_finished() else 0
+        self.state[base + CompactMap.F_ALIVE] = 1
+        self.state[self.grid_base + x * self.y_size + y] = cloned_unit.id
+        self.toggle_unit_key(cloned_unit)
+        self.clear_team_reach()
+        if team == Consts.RED_TEAM:
+            self.state[CompactMap.H_ALIVE_RED] += 1
+        else:
+            self.state[CompactMap.H_ALIVE_BLUE] += 1
+
+    def create_deep_clone(self):
+        """Create a copy of the map. The state buffer is copied, terrain is shared."""
+        new_map = CompactMap.__new__(CompactMap)
+        new_map.x_size = self.x_size
+        new_map.y_size = self.y_size
+        new_map.map_field_type = self.map_field_type
+        new_map.max_unit_num = self.max_unit_num
+        new_map.turn_count = self.turn_count
+        new_map.turn_limit = self.turn_limit
+        new_map.draw_hp_threshold = self.draw_hp_threshold
+        new_map.map_file_name = self.map_file_name
+        new_map.reverse = self.reverse
+        new_map.raw_map = self.raw_map
+        new_map.zobrist_key = self.zobrist_key
+        new_map.move_table = self.move_table
+        new_map.team_reach = self.team_reach
+        new_map.unit_capacity = self.unit_capacity
+        new_map.grid_base = self.grid_base
+        new_map.state = self.state[:]
+        new_map.views = [None] * self.unit_capacity
+        return new_map
+
+    def finish_all_units_action(self, team_color):
+        self.set_team_action_finished(team_color, 1)
+
+    def enable_units_action(self, team_color):
+        self.set_team_action_finished(team_color, 0)
+
+    def set_team_action_finished(self, team_color, flag):
+        state = self.state
+        base = CompactMap.UNIT_BASE
+        for _ in range(self.unit_capacity):
+            if state[base + CompactMap.F_ALIVE] and state[base + CompactMap.F_TEAM] == team_color \
+                    and state[base + CompactMap.F_FINISHED] != flag:
+                state[base + CompactMap.F_FINISHED] = flag
+                # Only the finished component of the unit key changes
+                self.zobrist_key ^= Zobrist.finished_keys[state[base + CompactMap.F_X] * Zobrist.MAX_MAP_SIZE + state[base + CompactMap.F_Y]]
+            base += CompactMap.UNIT_FIELDS
@@ -1,4 +1,5 @@
 from Action import Action
+from DamageTable import DamageTable
 from Logger import Logger
 
 
@@ -63,33 +64,12 @@ class DamageCalculator:
         Calculate attack damage and counter-attack damage.
         Version with Spec, HP, and number of stars as arguments.
         """
-        damages = [0, 0]
-        damages[0] = DamageCalculator.calculate_damage(atk_spec, atk_hp, target_spec, target_hp, target_stars)
-
-        # Calculation of counter-attack damage. However:
-        # - There is no counter-attack for ranged attacks.
-        # - Ranged attack units cannot counter-attack.
-        # - There is no counter-attack if the unit is destroyed.
-        if target_hp - damages[0] > 0 and atk_spec.is_direct_attack_type() and target_spec.is_direct_attack_type():
-            damages[1] = DamageCalculator.calculate_damage(target_spec, target_hp - damages[0], atk_spec, atk_hp, atk_stars)
-
-        return damages
+        # There is no counter-attack for ranged attacks, from ranged attack units, or if the unit is destroyed (see DamageTable).
+        return DamageTable.damages(atk_spec.get_unit_type(), atk_hp, target_spec.get_unit_type(), target_hp, atk_stars, target_stars)
 
     @staticmethod
     def calculate_damage(atk_spec, atk_hp, target_spec, target_hp, target_stars):
         """
         Calculate only attack damage.
         """
-        # If the target unit is an air unit, ignore the defensive effect of the terrain and set it to 0.
-        if target_spec.is_air_unit():
-            target_stars = 0
-
-        # Compatibility
-        atk_power = atk_spec.get_unit_atk_power(target_spec.get_unit_type())
-
-        # Damage calculation formula
-        raw_damage = ((atk_power * atk_hp) + 70) // (100 + (target_stars * target_hp))
-        if raw_damage > target_hp:
-            raw_damage = target_hp
-
-        return raw_damage
\ No newline at end of file
+        return DamageTable.damage(atk_spec.get_unit_type(), atk_hp, target_spec.get_unit_type(), target_hp, target_stars)
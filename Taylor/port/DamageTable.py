@@ -0,0 +1,63 @@
+import numpy as np
+
+from Consts import Consts
+from Spec import Spec
+
+
+class DamageTable:
+    """
+    Damage and counter-attack damage of every attack, computed once from Spec.atk_power_array.
+
+    DAMAGE[atk type][atk HP][target type][target HP][target stars] is the damage of
+    DamageCalculator.calculate_damage, and COUNTER[...][atk stars] (one more index) the
+    counter-attack damage the attacker takes back. HPs index directly (0 .. MAX_HP) and
+    stars are the terrain stars of Consts.FIELD_DEFENSE; air targets ignore them.
+    The arrays are for vectorized and compiled code; damage() and damages() read nested
+    list copies, which are faster for single lookups from Python.
+    """
+    MAX_HP = 10
+    MAX_STARS = max(Consts.FIELD_DEFENSE)
+
+    DAMAGE = None
+    COUNTER = None
+    damage_list = None
+    counter_list = None
+
+    @staticmethod
+    def build():
+        types = np.arange(Spec.SPECTYPENUM)
+        hps = np.arange(DamageTable.MAX_HP + 1)
+        stars = np.arange(DamageTable.MAX_STARS + 1)
+        a, ah, t, th, s = np.ix_(types, hps, types, hps, stars)
+
+        # Damage calculation formula, with terrain ignored for air targets
+        atk_power = np.array(Spec.atk_power_array, dtype=np.int64)[a, t]
+        s = np.where(np.array(Spec.air_unit)[t], 0, s)
+        damage = np.minimum((atk_power * ah + 70) // (100 + s * th), th)
+
+        # Counter-attack of the target with the HP it has left, hitting the attacker on its own stars.
+        # There is none if the target is destroyed or either unit attacks from range.
+        direct = np.array([spec.is_direct_attack_type() for spec in Spec.specs])
+        a, ah, t, th, ts, s = np.ix_(types, hps, types, hps, stars, stars)
+        rest_hp = th - damage[..., np.newaxis]
+        counter = damage[t, rest_hp, a, ah, s]
+        counter = np.where((rest_hp > 0) & direct[a] & direct[t], counter, 0)
+
+        DamageTable.DAMAGE = damage.astype(np.int8)
+        DamageTable.COUNTER = counter.astype(np.int8)
+        DamageTable.damage_list = damage.tolist()
+        DamageTable.counter_list = counter.tolist()
+
+    @staticmethod
+    def damage(atk_type, atk_hp, target_type, target_hp, target_stars):
+        """Damage of an attack"""
+        return DamageTable.damage_list[atk_type][atk_hp][target_type][target_hp][target_stars]
+
+    @staticmethod
+    def damages(atk_type, atk_hp, target_type, target_hp, atk_stars, target_stars):
+        """[damage, counter-attack damage] of an attack"""
+        return [DamageTable.damage_list[atk_type][atk_hp][target_type][target_hp][target_stars],
+                DamageTable.counter_list[atk_type][atk_hp][target_type][target_hp][target_stars][atk_stars]]
+
+
+DamageTable.build()
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EvalCache:
+    """
+    Bounded LRU cache of NN leaf evaluations in front of a StreamingEvaluator.
+
+    States are keyed canonically by (context, Zobrist key): the context identifies what else
+    the features depend on (the terrain), and the Zobrist key leaves unit ids out, so the same
+    placement reached by different move orders or by units swapping places shares one entry.
+
+    evaluate() streams leaves like StreamingEvaluator.evaluate, but only states it has no
+    value for reach the model: cached states are answered from the cache, and a state that
+    occurs several times in one call is evaluated once and shared by all its leaves.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0        # Leaves answered from the cache
+        self.duplicates = 0  # Leaves sharing the evaluation of an earlier leaf of the same call
+        self.misses = 0      # Leaves evaluated by the model
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def evaluate(self, evaluator, leaves, map_matrix, context):
+        """
+        Generator of (keys, values) like StreamingEvaluator.evaluate, for leaves given as
+        (key, Zobrist key, unit records). Values come in batches as the model returns them,
+        not in leaf order.
+        """
+        waiting = {}      # State key -> keys of the leaves waiting for its evaluation
+        miss_states = []  # State keys sent to the evaluator, by position
+        ready_keys = []
+        ready_values = []
+
+        def misses():
+            for key, zobrist_key, records in leaves:
+                state_key = (context, zobrist_key)
+                value = self.get(state_key)
+                if value is not None:
+                    ready_keys.append(key)
+                    ready_values.append(value)
+                    continue
+                keys = waiting.get(state_key)
+                if keys is not None:
+                    self.duplicates += 1
+                    keys.append(key)
+                    continue
+                self.misses += 1
+                waiting[state_key] = [key]
+                miss_states.append(state_key)
+                yield len(miss_states) - 1, records
+
+        for positions, values in evaluator.evaluate(misses(), map_matrix):
+            for position, value in zip(positions, values):
+                state_key = miss_states[position]
+                self.put(state_key, value)
+                keys = waiting.pop(state_key)
+                ready_keys.extend(keys)
+                ready_values.extend([value] * len(keys))
+            yield self.flush(ready_keys, ready_values)
+        if ready_keys:
+            yield self.flush(ready_keys, ready_values)
+
+    def get(self, state_key):
+        """Cached value of a (context, Zobrist key) state, or None"""
+        value = self.entries.get(state_key)
+        if value is not None:
+            self.hits += 1
+            self.entries.move_to_end(state_key)
+        return value
+
+    def put(self, state_key, value):
+        if len(self.entries) >= self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        self.entries[state_key] = value
+
+    @staticmethod
+    def flush(ready_keys, ready_values):
+        batch = (np.array(ready_keys, dtype=np.int64), np.array(ready_values, dtype=np.float64))
+        ready_keys.clear()
+        ready_values.clear()
+        return batch
+
+    def hit_rate(self):
+        """Share of the leaves that did not need a model evaluation"""
+        total = self.hits + self.duplicates + self.misses
+        return (self.hits + self.duplicates) / total if total > 0 else 0.0
+
+    def clear(self):
+        self.entries.clear()
+
+    def to_string(self):
+        return "size=" + str(len(self.entries)) + "/" + str(self.capacity) + " hits=" + str(self.hits) + \
+               " duplicates=" + str(self.duplicates) + " misses=" + str(self.misses) + \
+               " evictions=" + str(self.evictions) + " hit_rate=" + format(self.hit_rate(), ".3f")
@@ -9,6 +9,10 @@ class MGameTree:
         self.simnum = 0
         self.last_score = 0.0
         self.total_score = 0.0
+        self.sq_score = 0.0  # Sum of squared scores, for UCB1Tuned
+        self.prior = 1.0  # Prior of the action, for PUCT and progressive widening
         self.housyuu = 0.0  # Presumably some kind of reward or score
         self.act = Action()  # Assumed to be an object similar to the C# 'Action'
-        self.next = []  # List of MGameTree objects (child nodes)
\ No newline at end of file
+        self.next = []  # List of MGameTree objects (child nodes)
+        self.untried = []  # Actions not made children yet, best last (progressive widening)
+        self.new_turn = False  # Whether children of this node start a new turn
\ No newline at end of file
@@ -0,0 +1,126 @@
+from array import array
+
+import numpy as np
+
+
+class MGameTreeStore:
+    """
+    Search tree kept as parallel arrays instead of MGameTree objects.
+
+    A node is an integer index; node 0 is the root. Per node the store keeps the visit
+    count, total, squared and last score, prior, parent, first child, number of children,
+    depth and the id of the action leading to it in the action table. The children of a
+    node are created together, so they occupy first_child .. first_child + child_count.
+
+    No boards are stored. A node's position is the root position with the actions on
+    its path applied (path_actions), which the searches do in place with
+    Map.execute_action_inplace / undo_action_inplace.
+    """
+    NONE = -1  # Parent of the root, action of the root, first child of a leaf
+
+    def __init__(self):
+        self.simnum = array('i')
+        self.total_score = array('d')
+        self.sq_score = array('d')
+        self.last_score = array('d')
+        self.prior = array('d')
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.child_count = array('i')
+        self.depth = array('i')
+        self.action_id = array('i')
+        self.actions = []  # Action table
+        self.add_node(MGameTreeStore.NONE, MGameTreeStore.NONE, 0)
+
+    def __len__(self):
+        return len(self.simnum)
+
+    def add_node(self, parent, action_id, depth):
+        self.simnum.append(0)
+        self.total_score.append(0.0)
+        self.sq_score.append(0.0)
+        self.last_score.append(0.0)
+        self.prior.append(1.0)
+        self.parent.append(parent)
+        self.first_child.append(MGameTreeStore.NONE)
+        self.child_count.append(0)
+        self.depth.append(depth)
+        self.action_id.append(action_id)
+        return len(self.simnum) - 1
+
+    def add_children(self, node, actions):
+        """Expand node with one child per action"""
+        self.first_child[node] = len(self.simnum)
+        self.child_count[node] = len(actions)
+        depth = self.depth[node] + 1
+        for action in actions:
+            self.actions.append(action)
+            self.add_node(node, len(self.actions) - 1, depth)
+
+    def children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.child_count[node])
+
+    def is_expanded(self, node):
+        return self.child_count[node] > 0
+
+    def get_action(self, node):
+        return self.actions[self.action_id[node]]
+
+    def housyuu(self, node):
+        """Average score of node"""
+        return self.total_score[node] / self.simnum[node] if self.simnum[node] > 0 else 0.0
+
+    def update(self, node, score):
+        """Add one visit with score to node"""
+        self.simnum[node] += 1
+        self.last_score[node] = score
+        self.total_score[node] += score
+        self.sq_score[node] += score * score
+
+    def select_child(self, node, policy, parent_visits):
+        """Child of node chosen by a SelectionPolicy, read straight from the arrays"""
+        first = self.first_child[node]
+        end = first + self.child_count[node]
+        sq_scores = np.frombuffer(self.sq_score)[first:end] if policy.USES_SQ_SCORE else None
+        priors = np.frombuffer(self.prior)[first:end] if policy.USES_PRIOR else None
+        return first + policy.select(np.frombuffer(self.simnum, dtype=np.intc)[first:end],
+                                     np.frombuffer(self.total_score)[first:end],
+                                     parent_visits, sq_scores, priors)
+
+    def path_actions(self, node):
+        """Actions from the root to node, in the order they are played"""
+        path = []
+        while node != 0:
+            path.append(self.get_action(node))
+            node = self.parent[node]
+        path.reverse()
+        return path
+
+    def subtree(self, node):
+        """New store holding the subtree under node with node as its root. Everything else is left behind."""
+        tree = MGameTreeStore()
+        tree.simnum[0] = self.simnum[node]
+        tree.total_score[0] = self.total_score[node]
+        tree.sq_score[0] = self.sq_score[node]
+        tree.last_score[0] = self.last_score[node]
+        tree.prior[0] = self.prior[node]
+
+        # Breadth first, so the children of each node stay contiguous
+        queue = [(node, 0)]
+        depth_shift = self.depth[node]
+        for old, new in queue:
+            if not self.is_expanded(old):
+                continue
+            tree.first_child[new] = len(tree.simnum)
+            tree.child_count[new] = self.child_count[old]
+            for child in self.children(old):
+                tree.actions.append(self.get_action(child))
+                new_child = tree.add_node(new, len(tree.actions) - 1, self.depth[child] - depth_shift)
+                tree.simnum[new_child] = self.simnum[child]
+                tree.total_score[new_child] = self.total_score[child]
+                tree.sq_score[new_child] = self.sq_score[child]
+                tree.last_score[new_child] = self.last_score[child]
+                tree.prior[new_child] = self.prior[child]
+                queue.append((child, new_child))
+        return tree
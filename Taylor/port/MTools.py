@@ -1,6 +1,5 @@
 from Action import Action
 from RangeController import RangeController
-from DamageCalculator import DamageCalculator
 
 class MTools: 
     """Tools used in Monte Carlo Tree Search (MCTS)."""
@@ -36,11 +35,8 @@ class MTools:
 
         # Compile a list of movable positions for each unit
         for my_unit in my_movable_units:
-            reachable = RangeController.get_reachable_cells_matrix(my_unit, map_)
-            for i in range(len(reachable)):
-                for j in range(len(reachable[0])):
-                    if reachable[i][j]:
-                        move_actions.append(Action.create_move_only_action(my_unit, i, j))
+            for x, y in RangeController.get_reachable_cells(my_unit, map_):
+                move_actions.append(Action.create_move_only_action(my_unit, x, y))
 
         return move_actions
 
@@ -60,40 +56,34 @@ class MTools:
         """
         unit_actions = []
 
-        # Get attack actions
-        attack_actions = RangeController.get_attack_action_list(unit, map_)
+        # Get attack actions that deal damage
+        unit_actions.extend(RangeController.get_effective_attack_action_list(unit, map_))
 
-        for attack in attack_actions:
-            attack_damages = DamageCalculator.calculate_damages(map_, attack)  # Calculate attack and counter-attack damages
+        # Get move actions (border cells excluded)
+        x_max = map_.get_x_size() - 1
+        y_max = map_.get_y_size() - 1
 
-            if attack_damages[0] != 0:
-                unit_actions.append(attack)
+        for x, y in RangeController.get_reachable_cells(unit, map_):
+            if 0 < x < x_max and 0 < y < y_max:
+                # Uncomment the following block if additional checks are needed
+                """
+                exist_flag = False
 
-        # Get move actions
-        movable = RangeController.get_reachable_cells_matrix(unit, map_)
+                for enemy_unit in map_.get_units_list(unit.get_team_color(), False, False, True):
+                    pos_x = enemy_unit.get_x_pos()  # Enemy unit position
+                    pos_y = enemy_unit.get_y_pos()
 
-        for x in range(1, map_.get_x_size() - 1):
-            for y in range(1, map_.get_y_size() - 1):
-                if movable[x][y]:
-                    # Uncomment the following block if additional checks are needed
-                    """
-                    exist_flag = False
+                    DX = [1, 0, -1, 0]
+                    DY = [0, -1, 0, 1]
 
-                    for enemy_unit in map_.get_units_list(unit.get_team_color(), False, False, True):
-                        pos_x = enemy_unit.get_x_pos()  # Enemy unit position
-                        pos_y = enemy_unit.get_y_pos()
+                    for i in range(4):
+                        if x + DX[i] == pos_x and y + DY[i] == pos_y:
+                            exist_flag = True
+                            break
 
-                        DX = [1, 0, -1, 0]
-                        DY = [0, -1, 0, 1]
-
-                        for i in range(4):
-                            if x + DX[i] == pos_x and y + DY[i] == pos_y:
-                                exist_flag = True
-                                break
-
-                    if not exist_flag:
-                    """
-                    unit_actions.append(Action.create_move_only_action(unit, x, y))
+                if not exist_flag:
+                """
+                unit_actions.append(Action.create_move_only_action(unit, x, y))
 
         return unit_actions
 
@@ -3,10 +3,14 @@ from Action import Action
 from Unit import Unit
 from Logger import SGFManager
 from Logger import Logger
+from MoveTable import MoveTable
 from DamageCalculator import DamageCalculator
 from Spec import Spec
+from Zobrist import Zobrist
 
 class Map:
+    PHASE_CHANGE = -1  # Undo log type of change_phase_inplace
+
     def __init__(self, map_file_name=None, reversed=False, raw_map_str=None):
         self.x_size = None
         self.y_size = None
@@ -21,11 +25,21 @@ class Map:
         self.map_file_name = map_file_name
         self.reverse = reversed
         self.raw_map = raw_map_str
+        self.zobrist_key = 0  # Incrementally maintained Zobrist key of the state
+        self.move_table = None  # Movement tables for the terrain, built on first use
+        self.team_reach = [None, None]  # Per-team reachable cells, see get_team_reach
         
         # print(f'init {raw_map_str is None}')
         if map_file_name is not None or raw_map_str is not None:
             self.load_map_file(map_file_name, raw_map_str)
 
+    def __getstate__(self):
+        """Pickle without the terrain tables and reach cache, they are rebuilt on first use"""
+        state = self.__dict__.copy()
+        state["move_table"] = None
+        state["team_reach"] = [None, None]
+        return state
+
     def get_raw_map(self):
         return self.raw_map
     
@@ -58,6 +72,29 @@ class Map:
         """Get the entire terrain matrix"""
         return self.map_field_type
 
+    def get_move_table(self):
+        """Get the precomputed movement tables for this map's terrain (shared by clones)"""
+        if self.move_table is None:
+            self.move_table = MoveTable.for_terrain(self.map_field_type, self.x_size, self.y_size)
+        return self.move_table
+
+    def get_team_reach(self, team_color):
+        """Reachable cells of every alive unit of a team, as {unit id: sorted MoveTable indices}.
+        Computed for the whole team at once and cached until a unit is moved, added or removed."""
+        reach = self.team_reach[team_color]
+        if reach is None:
+            reach = self.get_move_table().team_reachable(team_color, self)
+            self.team_reach[team_color] = reach
+        return reach
+
+    def peek_team_reach(self, team_color):
+        """The cached result of get_team_reach, or None if it is not cached. Never computes it."""
+        return self.team_reach[team_color]
+
+    def clear_team_reach(self):
+        """Drop the cached reachable cells. Clones may share the cache list, so it is replaced, not cleared."""
+        self.team_reach = [None, None]
+
     def get_field_type(self, x, y):
         """Get the terrain at a specific position"""
         if x < 0 or x >= self.x_size or y < 0 or y >= self.y_size:
@@ -67,6 +104,27 @@ class Map:
     def get_turn_count(self):
         return self.turn_count
 
+    def get_zobrist_key(self):
+        """Get the 64-bit Zobrist key of the current state"""
+        return self.zobrist_key
+
+    def is_same_state(self, other):
+        """Whether other has the same turn count and the same units (by id) at the same position, HP and action state"""
+        if self.zobrist_key != other.zobrist_key or self.turn_count != other.turn_count:
+            return False
+        units = self.get_units()
+        other_units = other.get_units()
+        if len(units) != len(other_units):
+            return False
+        for unit, other_unit in zip(units, other_units):
+            if unit is None or other_unit is None:
+                if unit is not other_unit:
+                    return False
+            elif unit.get_x_pos() != other_unit.get_x_pos() or unit.get_y_pos() != other_unit.get_y_pos() or \
+                    unit.get_HP() != other_unit.get_HP() or unit.is_action_finished() != other_unit.is_action_finished():
+                return False
+        return True
+
     def get_turn_limit(self):
         return self.turn_limit
 
@@ -114,7 +172,7 @@ class Map:
         if action.action_type == Action.ACTIONTYPE_MOVEONLY:
             # Change the unit's position
             self.change_unit_location(action.destination_x_pos, action.destination_y_pos, op_unit)
-            op_unit.set_action_finished(True)  # Set the action finished flag
+            self.set_unit_action_finished(op_unit, True)  # Set the action finished flag
         elif action.action_type == Action.ACTIONTYPE_MOVEANDATTACK:
             target_unit = self.get_unit(action.target_unit_id)  # Target unit of the attack
 
@@ -122,21 +180,21 @@ class Map:
             self.change_unit_location(action.destination_x_pos, action.destination_y_pos, op_unit)
             damages = DamageCalculator.calculate_damages(self, action)  # Attack and counter-attack damages
 
-            target_unit.reduce_HP(damages[0])  # Reduce the HP of the target unit
+            self.reduce_unit_HP(target_unit, damages[0])  # Reduce the HP of the target unit
             if target_unit.get_HP() == 0:
                 self.delete_unit(target_unit)  # If the HP becomes 0 or less, delete the unit
 
-            op_unit.reduce_HP(damages[1])  # Counter-attack processing
+            self.reduce_unit_HP(op_unit, damages[1])  # Counter-attack processing
             if op_unit.get_HP() == 0:
                 self.delete_unit(op_unit)  # If destroyed by counter-attack, delete the unit
                 return
 
-            op_unit.set_action_finished(True)  # Set the action finished flag
+            self.set_unit_action_finished(op_unit, True)  # Set the action finished flag
         elif action.action_type == Action.ACTIONTYPE_TURNEND:
             movable_units = self.get_units_list(action.team_color, False, True, False)  # List of units that have not acted
 
             for unit in movable_units:
-                unit.set_action_finished(True)  # Set the action finished flag
+                self.set_unit_action_finished(unit, True)  # Set the action finished flag
 
     def load_map_file(self, file, raw_map_str=None):
         """Load the map at the start of the game"""
@@ -189,6 +247,8 @@ class Map:
         self.map_field_type = [[0] * self.y_size for _ in range(self.x_size)]
         self.map_unit = [[None] * self.y_size for _ in range(self.x_size)]
         self.units = [None] * (self.max_unit_num[0] + self.max_unit_num[1])
+        self.move_table = None
+        self.clear_team_reach()
 
         # Load map placement (MS = MapSet)
         st_list = []
@@ -225,6 +285,7 @@ class Map:
         # Initialize unit count
         self.num_of_alive_units[0] = 0
         self.num_of_alive_units[1] = 0
+        self.zobrist_key = Zobrist.turn_key(self.turn_count)
 
         # Load unit placement (US = UnitSet)
         for line in lines:
@@ -324,12 +385,12 @@ class Map:
         """Internally process the act. It can be fast-forwarded but not rewound."""
         if action.action_type == Action.ACTIONTYPE_MOVEONLY:
             self.change_unit_location(action.destination_x_pos, action.destination_y_pos, self.units[action.operation_unit_id])
-            self.units[action.operation_unit_id].set_action_finished(True)
+            self.set_unit_action_finished(self.units[action.operation_unit_id], True)
         elif action.action_type == Action.ACTIONTYPE_MOVEANDATTACK:
             self.change_unit_location(action.destination_x_pos, action.destination_y_pos, self.units[action.operation_unit_id])
-            self.units[action.operation_unit_id].reduce_HP(action.X_counter_damage)
-            self.units[action.target_unit_id].reduce_HP(action.X_attack_damage)
-            self.units[action.operation_unit_id].set_action_finished(True)
+            self.reduce_unit_HP(self.units[action.operation_unit_id], action.X_counter_damage)
+            self.reduce_unit_HP(self.units[action.target_unit_id], action.X_attack_damage)
+            self.set_unit_action_finished(self.units[action.operation_unit_id], True)
 
             if self.units[action.operation_unit_id].get_HP() <= 0:
                 self.delete_unit(self.units[action.operation_unit_id])
@@ -342,6 +403,8 @@ class Map:
 
         self.map_unit[x][y] = Unit(x, y, max_units_cnt, team, HP, action_finished, Spec.get_spec(name))
         self.units[max_units_cnt] = self.map_unit[x][y]
+        self.toggle_unit_key(self.map_unit[x][y])
+        self.clear_team_reach()
 
         if team == Consts.RED_TEAM:
             self.num_of_alive_units[0] += 1
@@ -355,13 +418,41 @@ class Map:
         self.enable_units_action(Consts.RED_TEAM)
 
     def set_turn_count(self, turn):
+        self.zobrist_key ^= Zobrist.turn_key(self.turn_count) ^ Zobrist.turn_key(turn)
         self.turn_count = turn
 
     def inc_turn_count(self):
+        self.zobrist_key ^= Zobrist.turn_key(self.turn_count) ^ Zobrist.turn_key(self.turn_count + 1)
         self.turn_count += 1
 
+    def toggle_unit_key(self, unit):
+        """XOR a unit's key in or out of the Zobrist key. Call before and after mutating the unit."""
+        self.zobrist_key ^= Zobrist.unit_key(unit)
+
+    def set_unit_HP(self, unit, hp):
+        """Set a unit's HP, keeping the Zobrist key up to date"""
+        self.toggle_unit_key(unit)
+        unit.set_HP(hp)
+        self.toggle_unit_key(unit)
+
+    def reduce_unit_HP(self, unit, value):
+        """Reduce a unit's HP (not below 0), keeping the Zobrist key up to date"""
+        self.toggle_unit_key(unit)
+        unit.reduce_HP(value)
+        self.toggle_unit_key(unit)
+
+    def set_unit_action_finished(self, unit, action_finish_flag):
+        """Set a unit's action finished flag, keeping the Zobrist key up to date"""
+        if unit.is_action_finished() == action_finish_flag:
+            return
+        self.toggle_unit_key(unit)
+        unit.set_action_finished(action_finish_flag)
+        self.toggle_unit_key(unit)
+
     def delete_unit(self, dead_unit):
         """Delete a destroyed unit"""
+        self.toggle_unit_key(dead_unit)
+        self.clear_team_reach()
         if dead_unit.get_team_color() == Consts.RED_TEAM:
             self.num_of_alive_units[0] -= 1
         elif dead_unit.get_team_color() == Consts.BLUE_TEAM:
@@ -381,9 +472,12 @@ class Map:
             print("Map: Bug. Unit attempting to move on top of other unit．")
         if temp_x_pos == x and temp_y_pos == y:
             return
+        self.toggle_unit_key(selected_unit)
+        self.clear_team_reach()
         self.map_unit[x][y] = selected_unit
         self.map_unit[temp_x_pos][temp_y_pos] = None
         selected_unit.set_pos(x, y)
+        self.toggle_unit_key(selected_unit)
 
 
         
@@ -392,10 +486,17 @@ class Map:
         Applies 'action' to this Map in-place, and returns an `undo_log` dict
         containing all necessary info to revert.
 
-        No usage of TURNEND. If after this action, no units can move for
-        current_color, the color switch occurs automatically outside
-        (e.g., in AI_M_UCT.determine_next_color).
+        TURNEND finishes the remaining units of current_color. The color switch
+        itself is not part of an action: when no units can move for current_color,
+        it is done outside (change_phase_inplace, or e.g. AI_M_UCT.determine_next_color).
         """
+        if action.action_type == Action.ACTIONTYPE_TURNEND:
+            undo_log = {"type": action.action_type, "finished_unit_ids": []}
+            for unit in self.get_units_list(current_color, False, True, False):
+                self.set_unit_action_finished(unit, True)
+                undo_log["finished_unit_ids"].append(unit.get_ID())
+            return undo_log
+
         op_unit = self.get_unit(action.operation_unit_id)
         undo_log = {
             "type": action.action_type,
@@ -417,7 +518,7 @@ class Map:
             self.change_unit_location(action.destination_x_pos,
                                       action.destination_y_pos, op_unit)
             # Mark action finished
-            op_unit.set_action_finished(True)
+            self.set_unit_action_finished(op_unit, True)
 
         elif action.action_type == Action.ACTIONTYPE_MOVEANDATTACK:
             target_unit = self.get_unit(action.target_unit_id)
@@ -432,7 +533,7 @@ class Map:
             damages = DamageCalculator.calculate_damages(self, action)
             # attacker -> target
             if target_unit:
-                target_unit.reduce_HP(damages[0])
+                self.reduce_unit_HP(target_unit, damages[0])
                 if target_unit.get_HP() == 0:
                     # record that target is removed
                     undo_log["target_unit_died"] = True
@@ -440,7 +541,7 @@ class Map:
                     self.delete_unit(target_unit)
 
             # target -> attacker (counter)
-            op_unit.reduce_HP(damages[1])
+            self.reduce_unit_HP(op_unit, damages[1])
             if op_unit.get_HP() == 0:
                 undo_log["op_unit_died"] = True
                 undo_log["removed_unit_2"] = op_unit.create_deep_clone()
@@ -449,16 +550,39 @@ class Map:
                 return undo_log
 
             # If still alive, mark action finished
-            op_unit.set_action_finished(True)
+            self.set_unit_action_finished(op_unit, True)
 
         # Return the log describing changes so we can undo later
         return undo_log
 
+    def change_phase_inplace(self, team_color):
+        """
+        In-place GameManager.change_phase at the end of team_color's phase: its units
+        can act again in its next phase and the turn count advances. Returns an
+        undo log for undo_action_inplace.
+        """
+        undo_log = {"type": Map.PHASE_CHANGE, "enabled_unit_ids": [], "old_turn_count": self.turn_count}
+        for unit in self.get_units_list(team_color, True, False, False):
+            self.set_unit_action_finished(unit, False)
+            undo_log["enabled_unit_ids"].append(unit.get_ID())
+        self.inc_turn_count()
+        return undo_log
+
     def undo_action_inplace(self, undo_log):
         """
         Reverts the map to the state before the action was executed in-place.
         Carefully restore positions, HP, alive/dead status, action_finished flags, etc.
         """
+        if undo_log["type"] == Action.ACTIONTYPE_TURNEND:
+            for unit_id in undo_log["finished_unit_ids"]:
+                self.set_unit_action_finished(self.get_unit(unit_id), False)
+            return
+        if undo_log["type"] == Map.PHASE_CHANGE:
+            self.set_turn_count(undo_log["old_turn_count"])
+            for unit_id in undo_log["enabled_unit_ids"]:
+                self.set_unit_action_finished(self.get_unit(unit_id), True)
+            return
+
         # If operation unit died, we might restore it
         op_unit_id = undo_log["op_unit_id"]
         if op_unit_id is not None and undo_log["op_unit_died"]:
@@ -477,16 +601,14 @@ class Map:
                 old_y = undo_log["old_y"]
                 if old_x != op_unit.get_x_pos() or old_y != op_unit.get_y_pos():
                     # Move back
-                    self.map_unit[op_unit.get_x_pos()][op_unit.get_y_pos()] = None
-                    self.map_unit[old_x][old_y] = op_unit
-                    op_unit.set_pos(old_x, old_y)
+                    self.change_unit_location(old_x, old_y, op_unit)
 
                 # revert HP
                 old_hp_op = undo_log["old_hp_op"]
-                op_unit.set_HP(old_hp_op)
+                self.set_unit_HP(op_unit, old_hp_op)
 
                 # revert action finished
-                op_unit.set_action_finished(undo_log["action_finished_old"])
+                self.set_unit_action_finished(op_unit, undo_log["action_finished_old"])
 
         # If target died, restore it
         target_unit_id = undo_log["target_unit_id"]
@@ -494,6 +616,8 @@ class Map:
             dead_target_clone = undo_log["removed_unit"]
             if dead_target_clone is not None:
                 self.restore_dead_unit(dead_target_clone)
+                # The clone was taken at HP 0
+                self.set_unit_HP(self.get_unit(target_unit_id), undo_log["old_hp_target"])
         else:
             # If the target is still alive, restore its HP
             if target_unit_id is not None:
@@ -501,7 +625,7 @@ class Map:
                 if t_unit is not None:
                     old_hp_target = undo_log["old_hp_target"]
                     if old_hp_target is not None:
-                        t_unit.set_HP(old_hp_target)
+                        self.set_unit_HP(t_unit, old_hp_target)
 
     def restore_dead_unit(self, cloned_unit):
         """
@@ -514,6 +638,8 @@ class Map:
         # Typically that shouldn't happen if we are careful. If needed, you can handle collisions.
         self.map_unit[x][y] = cloned_unit
         self.units[cloned_unit.id] = cloned_unit
+        self.toggle_unit_key(cloned_unit)
+        self.clear_team_reach()
         team = cloned_unit.get_team_color()
         if team == Consts.RED_TEAM:
             self.num_of_alive_units[0] += 1
@@ -523,7 +649,8 @@ class Map:
         # This is already consistent if the clone is faithful.
 
     def create_deep_clone(self):
-        """Create a deep copy of the map"""
+        """Create a deep copy of the map. The Zobrist key is recomputed while copying the units,
+        so the clone is consistent even if units of this map were mutated directly."""
         new_map = Map()
         new_map.x_size = self.x_size
         new_map.y_size = self.y_size
@@ -538,6 +665,9 @@ class Map:
         new_map.map_file_name = self.map_file_name
         new_map.reverse = self.reverse
         new_map.raw_map = self.raw_map
+        new_map.zobrist_key = Zobrist.turn_key(self.turn_count)
+        new_map.move_table = self.move_table
+        new_map.team_reach = self.team_reach  # Same unit placement, so the cache can be shared
 
         for unit in self.units:
             if unit is None:
@@ -545,6 +675,7 @@ class Map:
             new_unit = unit.create_deep_clone()
             new_map.map_unit[new_unit.get_x_pos()][new_unit.get_y_pos()] = new_unit
             new_map.units[new_unit.id] = new_unit
+            new_map.zobrist_key ^= Zobrist.unit_key(new_unit)
 
         return new_map
     
@@ -553,14 +684,14 @@ class Map:
             if unit is None:
                 continue
             if unit.get_team_color() == team_color:
-                unit.set_action_finished(True)
+                self.set_unit_action_finished(unit, True)
 
     def enable_units_action(self, team_color):
         for unit in self.units:
             if unit is None:
                 continue
             if unit.get_team_color() == team_color:
-                unit.set_action_finished(False)
+                self.set_unit_action_finished(unit, False)
 
     def to_string(self):
         map_str = "_"
@@ -571,15 +702,15 @@ class Map:
         for y in range(1, self.y_size - 1):
             map_str += "|"
             for x in range(1, self.x_size - 1):
-                if self.map_unit[x][y] is None:
+                if self.get_unit_at(x, y) is None:
                     map_str += "    |"
                     continue
-                if self.map_unit[x][y].get_team_color() == 0:
+                if self.get_unit_at(x, y).get_team_color() == 0:
                     map_str += "R"
                 else:
                     map_str += "B"
-                map_str += self.map_unit[x][y].get_mark()
-                map_str += str(self.map_unit[x][y].get_HP()).zfill(2)
+                map_str += self.get_unit_at(x, y).get_mark()
+                map_str += str(self.get_unit_at(x, y).get_HP()).zfill(2)
                 map_str += "|"
 
             map_str += "\r\n"
@@ -604,15 +735,15 @@ class Map:
                 if self.map_field_type[y][x] == 0:
                     map_str += "----|"
                     continue
-                elif self.map_unit[y][x] is None:
+                elif self.get_unit_at(y, x) is None:
                     map_str += "    |"
                     continue
-                if self.map_unit[y][x].get_team_color() == 0:
-                    map_str += "r" if self.map_unit[y][x].is_action_finished() else "R"
+                if self.get_unit_at(y, x).get_team_color() == 0:
+                    map_str += "r" if self.get_unit_at(y, x).is_action_finished() else "R"
                 else:
-                    map_str += "b" if self.map_unit[y][x].is_action_finished() else "B"
-                map_str += self.map_unit[y][x].get_mark()
-                map_str += str(self.map_unit[y][x].get_HP()).zfill(2)
+                    map_str += "b" if self.get_unit_at(y, x).is_action_finished() else "B"
+                map_str += self.get_unit_at(y, x).get_mark()
+                map_str += str(self.get_unit_at(y, x).get_HP()).zfill(2)
                 map_str += "|"
 
             map_str += "\r\n"
@@ -0,0 +1,238 @@
+import numpy as np
+
+from Consts import Consts
+from Spec import Spec
+
+
+class MoveTable:
+    """
+    Precomputed movement data for one map's terrain, used by RangeController.
+
+    Cells are addressed by a flat index into a grid padded with one ring of
+    barrier cells, index = (x + 1) * padded_y_size + (y + 1), so searches never
+    need bounds checks. For every unit type the table stores, per cell, the list
+    of (neighbor index, entry cost) pairs the type can ever enter.
+
+    Terrain never changes during a game, so a table is shared by all clones of a
+    map (see Map.get_move_table) and cached by terrain content across maps.
+    """
+    # Neighbor order matches RangeController.DX / DY
+    DX = [+1, 0, -1, 0]
+    DY = [0, -1, 0, +1]
+
+    CACHE_SIZE = 64  # Number of distinct terrains kept in the cache
+    BLOCKED = 99     # Entry cost of cells no unit can enter (barrier, enemy units)
+    cache = {}
+
+    @staticmethod
+    def for_terrain(map_field_type, x_size, y_size):
+        """Return the (cached) table for a terrain matrix"""
+        key = tuple(tuple(row) for row in map_field_type)
+        table = MoveTable.cache.get(key)
+        if table is None:
+            if len(MoveTable.cache) >= MoveTable.CACHE_SIZE:
+                MoveTable.cache.clear()
+            table = MoveTable(map_field_type, x_size, y_size)
+            MoveTable.cache[key] = table
+        return table
+
+    def __init__(self, map_field_type, x_size, y_size):
+        self.x_size = x_size
+        self.y_size = y_size
+        self.padded_y_size = y_size + 2
+        self.size = (x_size + 2) * self.padded_y_size
+        self.offsets = [MoveTable.DX[r] * self.padded_y_size + MoveTable.DY[r] for r in range(4)]
+
+        # Padded terrain, barrier outside the map
+        self.field = [0] * self.size
+        for x in range(x_size):
+            for y in range(y_size):
+                self.field[self.index(x, y)] = map_field_type[x][y]
+
+        # Coordinates of every in-map index
+        self.coords = [None] * self.size
+        for x in range(x_size):
+            for y in range(y_size):
+                self.coords[self.index(x, y)] = (x, y)
+
+        # Per unit type: neighbors[type][p] = [(q, cost), ...]
+        self.neighbors = []
+        for spec in Spec.specs:
+            type_neighbors = [()] * self.size
+            for p, coord in enumerate(self.coords):
+                if coord is None:
+                    continue
+                moves = []
+                for offset in self.offsets:
+                    q = p + offset
+                    cost = spec.get_move_cost(self.field[q])
+                    if cost <= spec.get_unit_step():
+                        moves.append((q, cost))
+                type_neighbors[p] = tuple(moves)
+            self.neighbors.append(type_neighbors)
+
+        # Per unit type entry cost of every cell as a NumPy row, for team_reachable
+        self.costs = np.full((len(Spec.specs), self.size), MoveTable.BLOCKED, dtype=np.int16)
+        for spec in Spec.specs:
+            for p, coord in enumerate(self.coords):
+                if coord is not None:
+                    self.costs[spec.get_unit_type(), p] = min(spec.get_move_cost(self.field[p]), MoveTable.BLOCKED)
+
+        # Defensive effect (stars) of every cell, for RolloutKernel
+        self.defense = np.array([Consts.FIELD_DEFENSE[field_type] for field_type in self.field], dtype=np.int64)
+
+    def index(self, x, y):
+        """Flat padded index of map cell (x, y)"""
+        return (x + 1) * self.padded_y_size + (y + 1)
+
+    def reachable_indices(self, op_unit, map_):
+        """
+        Indices of the cells op_unit can finally move to, in ascending (x-major) order.
+        Same rules as the original search: enemy units cannot be passed through,
+        allied units can but their cells are not destinations, and the unit's own
+        cell is always a destination.
+        """
+        spec = op_unit.get_spec()
+        unit_step = spec.get_unit_step()
+        unit_color = op_unit.get_team_color()
+        neighbors = self.neighbors[spec.get_unit_type()]
+
+        enemy_cells = set()
+        ally_cells = set()
+        for u in map_.get_units_list(unit_color, True, True, True):
+            if u.get_team_color() == unit_color:
+                ally_cells.add(self.index(u.get_x_pos(), u.get_y_pos()))
+            else:
+                enemy_cells.add(self.index(u.get_x_pos(), u.get_y_pos()))
+
+        start = self.index(op_unit.get_x_pos(), op_unit.get_y_pos())
+        visited = bytearray(self.size)
+        visited[start] = 1
+        found = [start]
+
+        # Bucket queue keyed by remaining movement; entry cost depends only on the
+        # destination cell, so the first visit of a cell has the most movement left.
+        buckets = [[] for _ in range(unit_step + 1)]
+        buckets[unit_step].append(start)
+        for rest_step in range(unit_step, 0, -1):
+            for p in buckets[rest_step]:
+                for q, cost in neighbors[p]:
+                    new_rest = rest_step - cost
+                    if new_rest < 0 or visited[q] or q in enemy_cells:
+                        continue
+                    visited[q] = 1
+                    found.append(q)
+                    buckets[new_rest].append(q)
+
+        reachable = [p for p in found if p == start or p not in ally_cells]
+        reachable.sort()
+        return reachable
+
+    def reachable_goals(self, op_unit, map_, goals):
+        """
+        The cells of goals (indices) op_unit can finally move to, as a set, by the same
+        rules as reachable_indices. Instead of flooding the whole movable range, the search
+        stops once every goal is settled, and does not expand cells farther (in Manhattan
+        distance) from every goal than the movement left there, since each step costs at
+        least 1.
+        """
+        remaining = {p for p in goals if self.coords[p] is not None}
+        if not remaining:
+            return set()
+        goal_coords = [self.coords[p] for p in remaining]
+
+        spec = op_unit.get_spec()
+        unit_step = spec.get_unit_step()
+        unit_color = op_unit.get_team_color()
+        neighbors = self.neighbors[spec.get_unit_type()]
+
+        enemy_cells = set()
+        ally_cells = set()
+        for u in map_.get_units_list(unit_color, True, True, True):
+            if u.get_team_color() == unit_color:
+                ally_cells.add(self.index(u.get_x_pos(), u.get_y_pos()))
+            else:
+                enemy_cells.add(self.index(u.get_x_pos(), u.get_y_pos()))
+
+        start = self.index(op_unit.get_x_pos(), op_unit.get_y_pos())
+        found = set()
+        if start in remaining:
+            found.add(start)
+            remaining.discard(start)
+        visited = bytearray(self.size)
+        visited[start] = 1
+
+        buckets = [[] for _ in range(unit_step + 1)]
+        buckets[unit_step].append(start)
+        for rest_step in range(unit_step, 0, -1):
+            if not remaining:
+                break
+            for p in buckets[rest_step]:
+                for q, cost in neighbors[p]:
+                    new_rest = rest_step - cost
+                    if new_rest < 0 or visited[q] or q in enemy_cells:
+                        continue
+                    visited[q] = 1
+                    if q in remaining:
+                        remaining.discard(q)
+                        if q not in ally_cells:
+                            found.add(q)
+                    if new_rest > 0:
+                        qx, qy = self.coords[q]
+                        for gx, gy in goal_coords:
+                            if abs(qx - gx) + abs(qy - gy) <= new_rest:
+                                buckets[new_rest].append(q)
+                                break
+        return found
+
+    def team_reachable(self, team_color, map_):
+        """
+        Reachable cells of every alive unit of a team, computed in one batch.
+        Returns {unit id: indices in ascending order}, the same lists reachable_indices
+        gives for each unit on its own.
+
+        The remaining movement of all units is relaxed together as a (units x cells)
+        array: each round a cell takes the best remaining movement of its four
+        neighbors minus its own entry cost. Every round costs at least one step, so
+        the largest unit step bounds the number of rounds. The barrier ring never
+        holds movement, so shifted slices need no bounds checks.
+        """
+        units = map_.get_units_list(team_color, True, True, False)
+        if not units:
+            return {}
+
+        starts = np.array([self.index(u.get_x_pos(), u.get_y_pos()) for u in units])
+        steps = np.array([u.get_spec().get_unit_step() for u in units], dtype=np.int16)
+        rows = np.arange(len(units))
+
+        costs = self.costs[[u.get_spec().get_unit_type() for u in units]]  # Fancy indexing copies
+        ally_cells = []
+        for u in map_.get_units_list(team_color, True, True, True):
+            if u.get_team_color() == team_color:
+                ally_cells.append(self.index(u.get_x_pos(), u.get_y_pos()))
+            else:
+                costs[:, self.index(u.get_x_pos(), u.get_y_pos())] = MoveTable.BLOCKED  # Enemy units cannot be passed through
+
+        # Only the in-map span [lo, hi) is relaxed; its neighbors are slices shifted by the offsets
+        lo = self.padded_y_size
+        hi = self.size - self.padded_y_size
+        rest = np.full((len(units), self.size), -1, dtype=np.int16)
+        rest[rows, starts] = steps
+        inner = rest[:, lo:hi]
+        inner_costs = costs[:, lo:hi]
+        best = np.empty_like(inner)
+        for _ in range(int(steps.max())):
+            np.maximum(rest[:, lo + self.offsets[0]:hi + self.offsets[0]], rest[:, lo + self.offsets[1]:hi + self.offsets[1]], out=best)
+            for offset in self.offsets[2:]:
+                np.maximum(best, rest[:, lo + offset:hi + offset], out=best)
+            best -= inner_costs
+            np.maximum(best, inner, out=best)
+            if np.array_equal(best, inner):
+                break
+            inner[...] = best
+
+        reachable = rest >= 0
+        reachable[:, ally_cells] = False  # Allied cells are not destinations...
+        reachable[rows, starts] = True    # ...except the unit's own cell
+
+        return {u.get_ID(): np.flatnonzero(reachable[i]).tolist() for i, u in enumerate(units)}
@@ -1,7 +1,10 @@
 # from Consts import Consts
 from AI_Simple import AI_Sample_MaxActEval
 from AI_MCTS import AI_M_UCT
+from AI_MCTS_PW import AI_M_UCT_PW
+from AI_MCTS_parallel import AI_M_UCT_Parallel
 from AI_Minimax import AI_Minimax
+from AI_Minimax_AB import AI_Minimax_AB
 
 from HumanPlayer import HumanPlayer
 # from NetworkPlayer import NetworkPlayer
@@ -21,7 +24,11 @@ class PlayerList:
         AI_Sample_MaxActEval(),
         HumanPlayer(),  # Don't change this
         AI_Minimax(),
-        AI_M_UCT()
+        AI_M_UCT(),
+        AI_M_UCT_Parallel(AI_M_UCT_Parallel.ROOT),
+        AI_M_UCT_Parallel(AI_M_UCT_Parallel.LEAF),
+        AI_M_UCT_PW(),
+        AI_Minimax_AB()
     ]
 
     # Register the indices of the 2 players you want to compete by default here.
@@ -1,98 +1,104 @@
 from Action import Action
+from DamageCalculator import DamageCalculator
 
 class RangeController:
     # Constants representing up, down, left, right
     DX = [+1, 0, -1, 0]
     DY = [0, -1, 0, +1]
 
+    @staticmethod
+    def get_reachable_indices(op_unit, map):
+        """Returns the movable range of opUnit as sorted MoveTable indices. The list may be shared, do not modify it.
+        Units placed on the map use the team-wide result cached by Map.get_team_reach;
+        any other unit object falls back to a search for that unit alone."""
+        on_map = map.get_unit_at(op_unit.get_x_pos(), op_unit.get_y_pos())
+        if on_map is not None and on_map.get_ID() == op_unit.get_ID():
+            return map.get_team_reach(op_unit.get_team_color())[op_unit.get_ID()]
+        return map.get_move_table().reachable_indices(op_unit, map)
+
+    @staticmethod
+    def get_reachable_cells(op_unit, map):
+        """Function that returns the movable range of opUnit as a list of (x, y), in x-major order.
+        Enemy units cannot be passed through, but allied units can (but cannot be the final destination)."""
+        coords = map.get_move_table().coords
+        return [coords[p] for p in RangeController.get_reachable_indices(op_unit, map)]
+
     @staticmethod
     def get_reachable_cells_matrix(op_unit, map):
         """Function that returns a bool matrix of the movable range of opUnit.
         Enemy units cannot be passed through, but allied units can (but cannot be the final destination)."""
-        unit_spec = op_unit.get_spec()  # Spec of the unit to be moved
-        unit_step = unit_spec.get_unit_step()  # Number of steps
-        unit_color = op_unit.get_team_color()  # Team of the unit to be moved
-
         reachable = [[False] * map.get_y_size() for _ in range(map.get_x_size())]  # Reachable or not. This is returned.
-
-        pos_counts = [0] * (unit_step + 1)  # Number of movable positions with remaining movement power as index.
-        pos_x = [[0] * 100 for _ in range(unit_step + 1)]  # Movable positions with remaining movement power as index.
-        pos_y = [[0] * 100 for _ in range(unit_step + 1)]  # 100 is an arbitrary number, should be made a constant.
-
-        # The current position is a movable position with remaining movement power unitStep and is also ultimately movable.
-        pos_counts[unit_step] = 1
-        pos_x[unit_step][0] = op_unit.get_x_pos()
-        pos_y[unit_step][0] = op_unit.get_y_pos()
-        reachable[op_unit.get_x_pos()][op_unit.get_y_pos()] = True
-
-        # From movable positions with remaining movement power restStep, look at their up, down, left, right,
-        # and add them to the list if they can be moved to.
-        for rest_step in range(unit_step, 0, -1):  # Current remaining movement cost
-            for i in range(pos_counts[rest_step]):
-                x = pos_x[rest_step][i]  # Position to focus on
-                y = pos_y[rest_step][i]
-
-                # Look at the up, down, left, right of this (x, y)
-                for r in range(4):
-                    new_x = x + RangeController.DX[r]  # Up, down, left, right
-                    new_y = y + RangeController.DY[r]
-
-                    # print(map.to_string())
-
-                    new_rest = rest_step - unit_spec.get_move_cost(map.get_field_type(new_x, new_y))  # Remaining movement cost after moving
-                    if new_rest < 0:
-                        continue  # Hit the edge or not enough movement power → Cannot enter
-
-                    u = map.get_unit_at(new_x, new_y)
-                    if u is not None:
-                        if u.get_team_color() != unit_color:
-                            continue  # Hit an enemy unit → Cannot enter
-
-                    # If it's not a position that has already been marked as movable, add it to the movable positions.
-                    if not reachable[new_x][new_y]:
-                        pos_x[new_rest][pos_counts[new_rest]] = new_x
-                        pos_y[new_rest][pos_counts[new_rest]] = new_y
-                        pos_counts[new_rest] += 1
-                        reachable[new_x][new_y] = True
-
-        # Positions occupied by allied units are ultimately not movable positions.
-        for u in map.get_units_list(unit_color, True, True, False):
-            reachable[u.get_x_pos()][u.get_y_pos()] = False
-
-        # It's up to you how to consider your own position, but if you want to make it movable:
-        reachable[op_unit.get_x_pos()][op_unit.get_y_pos()] = True
-
+        for x, y in RangeController.get_reachable_cells(op_unit, map):
+            reachable[x][y] = True
         return reachable
 
     @staticmethod
     def get_attack_action_list(op_unit, map):
         """Returns a list of opUnit's attack actions."""
+        return RangeController.get_attack_actions_on(op_unit, map, RangeController.get_enemies_in_range(op_unit, map))
+
+    @staticmethod
+    def get_effective_attack_action_list(op_unit, map):
+        """Returns opUnit's attack actions that deal damage, in the order of get_attack_action_list.
+        The attack damage does not depend on where opUnit attacks from, so targets are checked once,
+        by compatibility (Spec.atk_power_array) and then by damage, before any movement search."""
+        targets = []
+        for en_unit in RangeController.get_enemies_in_range(op_unit, map):
+            if not RangeController.is_effective(op_unit, en_unit):
+                continue
+            stars = map.get_field_defensive_effect(en_unit.get_x_pos(), en_unit.get_y_pos())
+            if DamageCalculator.calculate_damage(op_unit.get_spec(), op_unit.get_HP(), en_unit.get_spec(), en_unit.get_HP(), stars) != 0:
+                targets.append(en_unit)
+        return RangeController.get_attack_actions_on(op_unit, map, targets)
+
+    @staticmethod
+    def get_enemies_in_range(op_unit, map):
+        """Enemy units opUnit may be able to attack this turn: within its movement plus one for melee
+        attack types (a Manhattan bound, the terrain decides), within its attack range otherwise (exact)."""
+        u_spec = op_unit.get_spec()
+        x = op_unit.get_x_pos()
+        y = op_unit.get_y_pos()
+        if u_spec.is_direct_attack_type():
+            min_range = 1
+            max_range = u_spec.get_unit_step() + 1
+        else:
+            min_range = u_spec.get_unit_min_attack_range()
+            max_range = u_spec.get_unit_max_attack_range()
+        return [en_unit for en_unit in map.get_units_list(op_unit.get_team_color(), False, False, True)
+                if min_range <= abs(en_unit.get_x_pos() - x) + abs(en_unit.get_y_pos() - y) <= max_range]
+
+    @staticmethod
+    def get_attack_actions_on(op_unit, map, targets):
+        """Returns opUnit's attack actions on the given enemy units, in the order of targets."""
+        if not targets:
+            return []
         actions = []
 
         if op_unit.get_spec().is_direct_attack_type():  # If opUnit is a melee attack type
-            op_units_movable_range = RangeController.get_reachable_cells_matrix(op_unit, map)  # opUnit's movable range array
-
-            # Check if enemy units are adjacent to the movable range
-            for en_unit in map.get_units_list(op_unit.get_team_color(), False, False, True):
-                pos_x = en_unit.get_x_pos()  # Position of the enemy unit
-                pos_y = en_unit.get_y_pos()
-
-                for i in range(4):  # Look at the up, down, left, right of the enemy unit
-                    check_x = pos_x + RangeController.DX[i]
-                    check_y = pos_y + RangeController.DY[i]
-                    # if within bounds
-                    if 0 <= check_x < map.get_x_size() and 0 <= check_y < map.get_y_size() and \
-                        op_units_movable_range[check_x][check_y]:  # It means you can come to the position checkX, checkY and attack
-                        actions.append(Action.create_attack_action(op_unit, check_x, check_y, en_unit))
-        else:  # If it's an indirect attack type
-            u_spec = op_unit.get_spec()
-            # Check if enemy units are within the attackable range
-            for en_unit in map.get_units_list(op_unit.get_team_color(), False, False, True):
-                pos_x = en_unit.get_x_pos()  # Position of the enemy unit
-                pos_y = en_unit.get_y_pos()
-                dist = abs(pos_x - op_unit.get_x_pos()) + abs(pos_y - op_unit.get_y_pos())  # Distance between the enemy unit and yourself
-                if u_spec.get_unit_min_attack_range() <= dist <= u_spec.get_unit_max_attack_range():
-                    actions.append(Action.create_attack_action(op_unit, op_unit.get_x_pos(), op_unit.get_y_pos(), en_unit))  # Add to the list if it's within the attackable range
+            table = map.get_move_table()
+            # Cells next to the targets (padding keeps them in bounds), in up, down, left, right order
+            candidates = []
+            for en_unit in targets:
+                en_index = table.index(en_unit.get_x_pos(), en_unit.get_y_pos())  # Position of the enemy unit
+                for offset in table.offsets:
+                    candidates.append((en_unit, en_index + offset))
+
+            # Which of them opUnit can move to: from the team's cached movable ranges if present,
+            # otherwise by a search that only heads for these cells
+            team_reach = map.peek_team_reach(op_unit.get_team_color())
+            on_map = map.get_unit_at(op_unit.get_x_pos(), op_unit.get_y_pos())
+            if team_reach is not None and on_map is not None and on_map.get_ID() == op_unit.get_ID():
+                reachable = set(team_reach[op_unit.get_ID()])
+            else:
+                reachable = table.reachable_goals(op_unit, map, [check for _, check in candidates])
+
+            for en_unit, check in candidates:
+                if check in reachable:  # It means you can come to this position and attack
+                    check_x, check_y = table.coords[check]
+                    actions.append(Action.create_attack_action(op_unit, check_x, check_y, en_unit))
+        else:  # If it's an indirect attack type, the targets are already within the attackable range
+            for en_unit in targets:
+                actions.append(Action.create_attack_action(op_unit, op_unit.get_x_pos(), op_unit.get_y_pos(), en_unit))
 
         return actions
 
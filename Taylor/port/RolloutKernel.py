@@ -0,0 +1,321 @@
+import random
+
+import numpy as np
+from numba import njit
+
+from CompactMap import CompactMap
+from DamageTable import DamageTable
+from Spec import Spec
+
+
+# Unit record layout shared with CompactMap. Module level so numba freezes them as constants.
+F_X = CompactMap.F_X
+F_Y = CompactMap.F_Y
+F_TYPE = CompactMap.F_TYPE
+F_TEAM = CompactMap.F_TEAM
+F_HP = CompactMap.F_HP
+F_FINISHED = CompactMap.F_FINISHED
+F_ALIVE = CompactMap.F_ALIVE
+UNIT_FIELDS = CompactMap.UNIT_FIELDS
+
+# Spec tables as arrays, indexed by unit type
+STEP = np.array([spec.get_unit_step() for spec in Spec.specs], dtype=np.int64)
+MIN_RANGE = np.array([spec.get_unit_min_attack_range() for spec in Spec.specs], dtype=np.int64)
+MAX_RANGE = np.array([spec.get_unit_max_attack_range() for spec in Spec.specs], dtype=np.int64)
+DIRECT = np.array([spec.is_direct_attack_type() for spec in Spec.specs], dtype=np.bool_)
+DAMAGE = DamageTable.DAMAGE
+COUNTER = DamageTable.COUNTER
+MAX_STEP = int(STEP.max())
+
+ATTACK_RATE = 0.8  # Probability of picking from all attack actions, as in AI_M_UCT.random_simulation
+
+
+class RolloutKernel:
+    """
+    Compiled version of the M-UCT random playout (AI_M_UCT.random_simulation followed by
+    evaluate_state_value).
+
+    The state is the CompactMap unit record array (x, y, type, team, HP, finished, alive)
+    plus an occupancy grid in MoveTable's padded index space, so the terrain tables
+    (MoveTable.costs / MoveTable.defense) are used as they are. The policy is the same:
+    with probability 0.8 a uniformly random attack among all attack actions of the side
+    to move (if any), otherwise a random movable unit takes a random action from
+    MTools.get_unit_actions. Damage follows DamageCalculator, and the playout ends at the
+    turn limit or as soon as one team is annihilated (the score is decided from then on).
+
+    A unit with no action at all (MTools.get_unit_actions empty, which makes the Python
+    playout raise) just ends its action in place.
+    """
+
+    @staticmethod
+    def encode_units(map_):
+        """Unit records of a map as an int64 (units x UNIT_FIELDS) array (a copy)"""
+        if isinstance(map_, CompactMap):
+            records = np.frombuffer(map_.state, dtype=np.int16)[CompactMap.UNIT_BASE:map_.grid_base]
+            return records.reshape(-1, UNIT_FIELDS).astype(np.int64)
+
+        units = np.zeros((len(map_.get_units()), UNIT_FIELDS), dtype=np.int64)
+        for unit in map_.get_units():
+            if unit is None:
+                continue
+            record = units[unit.get_ID()]
+            record[F_X] = unit.get_x_pos()
+            record[F_Y] = unit.get_y_pos()
+            record[F_TYPE] = unit.get_type_of_unit()
+            record[F_TEAM] = unit.get_team_color()
+            record[F_HP] = unit.get_HP()
+            record[F_FINISHED] = 1 if unit.is_action_finished() else 0
+            record[F_ALIVE] = 1
+        return units
+
+    @staticmethod
+    def rollout_value(map_, team_color, seed=None):
+        """
+        Play one random game from map_ and return its evaluate_state_value score for team_color.
+        map_ is not modified. Without a seed, one is drawn from the random module.
+        """
+        if seed is None:
+            seed = random.getrandbits(31)
+        table = map_.get_move_table()
+        return _rollout(RolloutKernel.encode_units(map_), table.costs, table.defense,
+                        map_.get_x_size(), map_.get_y_size(), map_.get_turn_count(), map_.get_turn_limit(),
+                        map_.get_draw_hp_threshold(), team_color, seed)
+
+
+@njit(cache=True)
+def _damage(atk_type, atk_hp, target_type, target_hp, target_stars):
+    """DamageCalculator.calculate_damage"""
+    return DAMAGE[atk_type, atk_hp, target_type, target_hp, target_stars]
+
+
+@njit(cache=True)
+def _reach(units, uid, occ, costs, offsets, padded_y_size, rest, visited, buckets, bucket_counts, found):
+    """MoveTable.reachable_indices for one unit; fills found and returns the count"""
+    unit_type = units[uid, F_TYPE]
+    team = units[uid, F_TEAM]
+    step = STEP[unit_type]
+    start = (units[uid, F_X] + 1) * padded_y_size + units[uid, F_Y] + 1
+
+    bucket_counts[:] = 0
+    rest[start] = step
+    visited[0] = start
+    num_visited = 1
+    buckets[step, 0] = start
+    bucket_counts[step] = 1
+    for rest_step in range(step, 0, -1):
+        for i in range(bucket_counts[rest_step]):
+            p = buckets[rest_step, i]
+            for offset in offsets:
+                q = p + offset
+                new_rest = rest_step - costs[unit_type, q]
+                if new_rest < 0 or rest[q] >= 0:
+                    continue
+                other = occ[q]
+                if other >= 0 and units[other, F_TEAM] != team:
+                    continue  # Enemy units cannot be passed through
+                rest[q] = new_rest
+                visited[num_visited] = q
+                num_visited += 1
+                buckets[new_rest, bucket_counts[new_rest]] = q
+                bucket_counts[new_rest] += 1
+
+    count = 0
+    for i in range(num_visited):
+        q = visited[i]
+        rest[q] = -1
+        if q == start or occ[q] < 0:  # Allied cells are not destinations
+            found[count] = q
+            count += 1
+    return count
+
+
+@njit(cache=True)
+def _unit_actions(units, uid, occ, costs, defense, offsets, x_size, y_size, with_moves,
+                  rest, visited, buckets, bucket_counts, found, mark, acts, count):
+    """
+    Append the actions of one unit to acts as (unit id, destination, target id or -1) rows.
+    with_moves=False gives RangeController.get_attack_action_list, with_moves=True gives
+    MTools.get_unit_actions (effective attacks, then moves off the map border).
+    """
+    padded_y_size = y_size + 2
+    unit_type = units[uid, F_TYPE]
+    team = units[uid, F_TEAM]
+    x = units[uid, F_X]
+    y = units[uid, F_Y]
+    hp = units[uid, F_HP]
+
+    num_found = 0
+    if DIRECT[unit_type] or with_moves:
+        num_found = _reach(units, uid, occ, costs, offsets, padded_y_size, rest, visited, buckets, bucket_counts, found)
+
+    if DIRECT[unit_type]:
+        for i in range(num_found):
+            mark[found[i]] = True
+    for target in range(units.shape[0]):
+        if units[target, F_ALIVE] == 0 or units[target, F_TEAM] == team:
+            continue
+        target_type = units[target, F_TYPE]
+        target_hp = units[target, F_HP]
+        target_cell = (units[target, F_X] + 1) * padded_y_size + units[target, F_Y] + 1
+        if with_moves and _damage(unit_type, hp, target_type, target_hp, defense[target_cell]) == 0:
+            continue
+        if DIRECT[unit_type]:
+            for offset in offsets:
+                cell = target_cell + offset
+                if mark[cell]:
+                    acts[count, 0] = uid
+                    acts[count, 1] = cell
+                    acts[count, 2] = target
+                    count += 1
+        else:
+            dist = abs(units[target, F_X] - x) + abs(units[target, F_Y] - y)
+            if MIN_RANGE[unit_type] <= dist <= MAX_RANGE[unit_type]:
+                acts[count, 0] = uid
+                acts[count, 1] = (x + 1) * padded_y_size + y + 1
+                acts[count, 2] = target
+                count += 1
+    if DIRECT[unit_type]:
+        for i in range(num_found):
+            mark[found[i]] = False
+
+    if with_moves:
+        for i in range(num_found):
+            cell = found[i]
+            cx = cell // padded_y_size - 1
+            cy = cell % padded_y_size - 1
+            if 0 < cx < x_size - 1 and 0 < cy < y_size - 1:
+                acts[count, 0] = uid
+                acts[count, 1] = cell
+                acts[count, 2] = -1
+                count += 1
+    return count
+
+
+@njit(cache=True)
+def _kill(units, occ, alive, padded_y_size, uid):
+    units[uid, F_ALIVE] = 0
+    occ[(units[uid, F_X] + 1) * padded_y_size + units[uid, F_Y] + 1] = -1
+    alive[units[uid, F_TEAM]] -= 1
+
+
+@njit(cache=True)
+def _execute(units, occ, alive, defense, padded_y_size, uid, dest, target):
+    """Map.execute_action for a move-only (target -1) or move-and-attack action"""
+    occ[(units[uid, F_X] + 1) * padded_y_size + units[uid, F_Y] + 1] = -1
+    occ[dest] = uid
+    units[uid, F_X] = dest // padded_y_size - 1
+    units[uid, F_Y] = dest % padded_y_size - 1
+
+    if target >= 0:
+        atk_type = units[uid, F_TYPE]
+        atk_hp = units[uid, F_HP]
+        target_type = units[target, F_TYPE]
+        target_hp = units[target, F_HP]
+        target_cell = (units[target, F_X] + 1) * padded_y_size + units[target, F_Y] + 1
+
+        attack_damage = _damage(atk_type, atk_hp, target_type, target_hp, defense[target_cell])
+        counter_damage = COUNTER[atk_type, atk_hp, target_type, target_hp, defense[target_cell], defense[dest]]
+
+        units[target, F_HP] = target_hp - attack_damage
+        if units[target, F_HP] == 0:
+            _kill(units, occ, alive, padded_y_size, target)
+
+        units[uid, F_HP] = max(atk_hp - counter_damage, 0)
+        if units[uid, F_HP] == 0:
+            _kill(units, occ, alive, padded_y_size, uid)
+            return
+
+    units[uid, F_FINISHED] = 1
+
+
+@njit(cache=True)
+def _evaluate(units, alive, team_color, draw_hp_threshold):
+    """AI_M_UCT.evaluate_state_value"""
+    if alive[team_color] == 0:
+        return 0.0
+    if alive[1 - team_color] == 0:
+        return 1.0
+
+    my_total_hp = 0
+    enemy_total_hp = 0
+    for uid in range(units.shape[0]):
+        if units[uid, F_ALIVE] == 0:
+            continue
+        if units[uid, F_TEAM] == team_color:
+            my_total_hp += units[uid, F_HP]
+        else:
+            enemy_total_hp += units[uid, F_HP]
+
+    if my_total_hp - enemy_total_hp >= draw_hp_threshold:
+        return 1.0
+    elif abs(my_total_hp - enemy_total_hp) < draw_hp_threshold:
+        return 0.5
+    return 0.0
+
+
+@njit(cache=True)
+def _rollout(units, costs, defense, x_size, y_size, turn_count, turn_limit, draw_hp_threshold, team_color, seed):
+    np.random.seed(seed)
+    num_units = units.shape[0]
+    padded_y_size = y_size + 2
+    size = (x_size + 2) * padded_y_size
+    offsets = np.array([padded_y_size, -1, -padded_y_size, 1])  # DX / DY order of RangeController
+
+    occ = np.full(size, -1, dtype=np.int64)
+    alive = np.zeros(2, dtype=np.int64)
+    for uid in range(num_units):
+        if units[uid, F_ALIVE]:
+            occ[(units[uid, F_X] + 1) * padded_y_size + units[uid, F_Y] + 1] = uid
+            alive[units[uid, F_TEAM]] += 1
+
+    # Scratch buffers
+    rest = np.full(size, -1, dtype=np.int64)
+    visited = np.empty(size, dtype=np.int64)
+    buckets = np.empty((MAX_STEP + 1, size), dtype=np.int64)
+    bucket_counts = np.zeros(MAX_STEP + 1, dtype=np.int64)
+    found = np.empty(size, dtype=np.int64)
+    mark = np.zeros(size, dtype=np.bool_)
+    acts = np.empty((4 * num_units * num_units + size, 3), dtype=np.int64)
+    pending = np.empty(num_units, dtype=np.int64)
+
+    color = team_color
+    while turn_count < turn_limit and alive[0] > 0 and alive[1] > 0:
+        # Units of the side to move that have not acted yet
+        num_pending = 0
+        for uid in range(num_units):
+            if units[uid, F_ALIVE] and units[uid, F_TEAM] == color and units[uid, F_FINISHED] == 0:
+                pending[num_pending] = uid
+                num_pending += 1
+
+        while num_pending > 0:
+            count = 0
+            if np.random.random() < ATTACK_RATE:
+                for i in range(num_pending):
+                    count = _unit_actions(units, pending[i], occ, costs, defense, offsets, x_size, y_size, False,
+                                          rest, visited, buckets, bucket_counts, found, mark, acts, count)
+            if count == 0:
+                uid = pending[np.random.randint(0, num_pending)]
+                count = _unit_actions(units, uid, occ, costs, defense, offsets, x_size, y_size, True,
+                                      rest, visited, buckets, bucket_counts, found, mark, acts, 0)
+            if count == 0:
+                units[uid, F_FINISHED] = 1
+            else:
+                k = np.random.randint(0, count)
+                uid = acts[k, 0]
+                _execute(units, occ, alive, defense, padded_y_size, uid, acts[k, 1], acts[k, 2])
+
+            for i in range(num_pending):
+                if pending[i] == uid:
+                    num_pending -= 1
+                    pending[i] = pending[num_pending]
+                    break
+            if alive[0] == 0 or alive[1] == 0:
+                break
+
+        for uid in range(num_units):
+            if units[uid, F_ALIVE] and units[uid, F_TEAM] == color:
+                units[uid, F_FINISHED] = 0
+        turn_count += 1
+        color = 1 - color
+
+    return _evaluate(units, alive, team_color, draw_hp_threshold)
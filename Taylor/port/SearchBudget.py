@@ -0,0 +1,72 @@
+import time
+
+
+class SearchBudget:
+    """
+    Search limit shared by the search agents: wall clock, node count and/or rollout count,
+    whichever runs out first. A player keeps one instance, calls start() at the top of
+    make_action, counts work with add_nodes() / add_rollouts(), polls is_exhausted() in its
+    search loop and calls stop() before returning its best-so-far action.
+
+    The time limit works per turn as in the C# M-UCT: the turn time is reset at the start
+    of the turn, each action gets an equal share of what is left among the units that still
+    have to move, and the time an action really used is charged to the turn.
+    """
+
+    def __init__(self):
+        self.time_left_ms = None  # Time left in the current turn
+        self.time_limit_ms = None
+        self.max_nodes = None
+        self.max_rollouts = None
+        self.start_time = time.perf_counter()
+        self.nodes = 0
+        self.rollouts = 0
+        self.expired = False
+
+    def start(self, turn_start, movable_units, turn_time_ms=None, max_nodes=None, max_rollouts=None):
+        """
+        Start the budget of one action. None (or a negative value, like MAX_SIM < 0 in the
+        C# M-UCT) means no limit of that kind.
+        :param turn_start: Whether this is the first action of the turn
+        :param movable_units: Number of units that have not moved yet, including this one
+        :param turn_time_ms: Time for the whole turn in milliseconds
+        """
+        self.time_limit_ms = None
+        if turn_time_ms is not None and turn_time_ms >= 0:
+            if turn_start or self.time_left_ms is None:
+                self.time_left_ms = turn_time_ms
+            self.time_limit_ms = self.time_left_ms / max(movable_units, 1)
+        self.max_nodes = max_nodes if max_nodes is not None and max_nodes >= 0 else None
+        self.max_rollouts = max_rollouts if max_rollouts is not None and max_rollouts >= 0 else None
+        self.start_time = time.perf_counter()
+        self.nodes = 0
+        self.rollouts = 0
+        self.expired = False
+
+    def stop(self):
+        """End the action, charge its time to the turn and return the elapsed milliseconds"""
+        elapsed = self.elapsed_ms()
+        if self.time_left_ms is not None:
+            self.time_left_ms = max(self.time_left_ms - elapsed, 0)
+        return elapsed
+
+    def add_nodes(self, count=1):
+        self.nodes += count
+
+    def add_rollouts(self, count=1):
+        self.rollouts += count
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start_time) * 1000
+
+    def is_exhausted(self):
+        """Whether the search should stop. Counters are compared first; once the time is up it stays up."""
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            return True
+        if self.max_rollouts is not None and self.rollouts >= self.max_rollouts:
+            return True
+        if self.time_limit_ms is None:
+            return False
+        if not self.expired:
+            self.expired = time.perf_counter() - self.start_time >= self.time_limit_ms / 1000
+        return self.expired
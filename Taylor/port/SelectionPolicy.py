@@ -0,0 +1,110 @@
+import numpy as np
+
+
+class SelectionPolicy:
+    """
+    Child selection of the M-UCT searches, computed for all children of a node at once.
+
+    select() takes the children's statistics as arrays and returns the index of the child
+    to search. The UCB policies search unvisited children first (the one with the highest
+    prior if priors are given, else the first one) and only then compare scores; PUCT
+    scores unvisited children like any other through their prior.
+
+    Subclasses define scores() and say which optional inputs they read, so callers only
+    gather squared scores or priors when needed.
+    """
+    USES_SQ_SCORE = False  # Reads the sum of squared scores of each child
+    USES_PRIOR = False     # Reads the prior of each child
+    UNVISITED_FIRST = True
+
+    def __init__(self, c):
+        self.c = c  # Exploration constant
+
+    def get_name(self):
+        return type(self).__name__ + "(" + str(self.c) + ")"
+
+    def scores(self, visits, total_scores, parent_visits, sq_scores, priors):
+        """Score of every child; only called with visits > 0 for UNVISITED_FIRST policies"""
+        raise NotImplementedError
+
+    def select(self, visits, total_scores, parent_visits, sq_scores=None, priors=None):
+        """
+        Index of the child to search.
+        :param visits: Visit count of each child
+        :param total_scores: Sum of the scores backed up through each child
+        :param parent_visits: Visit count used for the parent in the exploration term
+        :param sq_scores: Sum of squared scores of each child (if USES_SQ_SCORE)
+        :param priors: Prior of each child, not necessarily normalized (optional)
+        """
+        visits = np.asarray(visits, dtype=np.float64)
+        if self.UNVISITED_FIRST:
+            unvisited = np.flatnonzero(visits == 0)
+            if len(unvisited) > 0:
+                if priors is None:
+                    return int(unvisited[0])
+                return int(unvisited[np.argmax(np.asarray(priors)[unvisited])])
+        return int(np.argmax(self.scores(visits, np.asarray(total_scores, dtype=np.float64),
+                                         max(parent_visits, 1), sq_scores, priors)))
+
+    def select_from(self, stats, parent_visits, priors=None):
+        """
+        select() over a list of objects with simnum, total_score and sq_score attributes
+        (MGameTree, TTEntry). Priors are read from their prior attribute unless given.
+        """
+        n = len(stats)
+        visits = np.fromiter((s.simnum for s in stats), np.float64, n)
+        total_scores = np.fromiter((s.total_score for s in stats), np.float64, n)
+        sq_scores = None
+        if self.USES_SQ_SCORE:
+            sq_scores = np.fromiter((s.sq_score for s in stats), np.float64, n)
+        if priors is None and self.USES_PRIOR:
+            priors = np.fromiter((s.prior for s in stats), np.float64, n)
+        return self.select(visits, total_scores, parent_visits, sq_scores, priors)
+
+
+class UCB1(SelectionPolicy):
+    """mean + c * sqrt(ln N / n)"""
+
+    def __init__(self, c=0.15):
+        super().__init__(c)
+
+    def scores(self, visits, total_scores, parent_visits, sq_scores, priors):
+        return total_scores / visits + self.c * np.sqrt(np.log(parent_visits) / visits)
+
+
+class UCB1Tuned(SelectionPolicy):
+    """
+    mean + c * sqrt(ln N / n * min(1/4, V)), V = sample variance + sqrt(2 ln N / n).
+    Scores are assumed to lie in [0, 1], whose variance is at most 1/4.
+    """
+    USES_SQ_SCORE = True
+
+    def __init__(self, c=1.0):
+        super().__init__(c)
+
+    def scores(self, visits, total_scores, parent_visits, sq_scores, priors):
+        log_n = np.log(parent_visits)
+        means = total_scores / visits
+        variances = np.asarray(sq_scores, dtype=np.float64) / visits - means * means + np.sqrt(2 * log_n / visits)
+        return means + self.c * np.sqrt(log_n / visits * np.minimum(0.25, variances))
+
+
+class PUCT(SelectionPolicy):
+    """
+    mean + c * P * sqrt(N) / (1 + n), P the normalized prior (uniform without priors).
+    Unvisited children have mean 0, so high-prior children are tried first.
+    """
+    USES_PRIOR = True
+    UNVISITED_FIRST = False
+
+    def __init__(self, c=1.0):
+        super().__init__(c)
+
+    def scores(self, visits, total_scores, parent_visits, sq_scores, priors):
+        if priors is None:
+            priors = np.full(len(visits), 1.0 / len(visits))
+        else:
+            priors = np.asarray(priors, dtype=np.float64)
+            priors = priors / priors.sum()
+        means = np.divide(total_scores, visits, out=np.zeros_like(total_scores), where=visits > 0)
+        return means + self.c * priors * np.sqrt(parent_visits) / (1 + visits)
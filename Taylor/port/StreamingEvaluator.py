@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from CompactMap import CompactMap
+from MapUtils import MapUtils
+from UnitData import UnitData
+
+
+class StreamingEvaluator:
+    """
+    Evaluates a stream of leaf states with an NNModel in fixed-size batches.
+
+    Leaves come from any iterable of (key, unit records) pairs, the records in the
+    CompactMap unit layout (see AI_Minimax.snapshot_units). The leaves of a batch are
+    featurized together (MapUtils.create_data_matrices_batch; one leaf at a time with
+    create_data_matrices if fast is off) into preallocated float32 column buffers of
+    batch_size leaves. There are two sets of buffers: when one is full it is inferred on a
+    background thread while the next batch is featurized into the other one, so
+    featurization and inference overlap and no more than two batches of features exist at
+    a time.
+    """
+
+    def __init__(self, model, max_units, fast=True, mask=False, batch_size=256):
+        self.model = model
+        self.max_units = max_units
+        self.fast = fast
+        self.mask = mask
+        self.batch_size = batch_size
+        self.buffers = None  # Two lists of column buffers, allocated from the first batch's features
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def evaluate(self, leaves, map_matrix):
+        """
+        Generator of (keys, values) per batch, in leaf order: keys of the leaves as an
+        array and the model's outputs for them. map_matrix is the terrain of every leaf.
+        """
+        pending = None  # (future, keys) of the batch being inferred
+        current = 0     # Buffer set being filled
+        keys = []
+        records = []
+        for key, leaf_records in leaves:
+            keys.append(key)
+            records.append(leaf_records)
+
+            if len(keys) == self.batch_size:
+                # The buffer set of the pending batch is not touched, so it is featurized meanwhile
+                columns = self.featurize_batch(records, map_matrix, current)
+                if pending is not None:
+                    yield self.collect(pending)
+                pending = (self.executor.submit(self.infer, columns, len(keys)), keys)
+                current = 1 - current
+                keys = []
+                records = []
+
+        if keys:
+            columns = self.featurize_batch(records, map_matrix, current)
+        if pending is not None:
+            yield self.collect(pending)
+        if keys:
+            yield np.array(keys), self.infer(columns, len(keys))
+
+    def featurize_batch(self, records, map_matrix, current):
+        """Features of the leaves with records, written to buffer set current"""
+        if self.fast:
+            states, counts = self.to_states(records, self.max_units)
+            mats_list = [MapUtils.create_data_matrices_batch(states, counts, map_matrix, self.max_units, self.mask)]
+        else:
+            mats_list = [[np.asarray(mat)[np.newaxis] for mat in self.featurize(leaf_records, map_matrix)]
+                         for leaf_records in records]
+        if self.buffers is None:
+            self.allocate([mat[0] for mat in mats_list[0]])
+
+        columns = self.buffers[current]
+        position = 0
+        for mats in mats_list:
+            count = len(mats[0])
+            for column, mat in zip(columns, mats):
+                column[position:position + count] = mat
+            position += count
+        return columns
+
+    def featurize(self, records, map_matrix):
+        return MapUtils.create_data_matrices(self.to_unit_list(records), map_matrix, self.max_units, self.fast, self.mask)
+
+    def allocate(self, mats):
+        self.buffers = [[np.empty((self.batch_size,) + np.shape(mat), dtype=np.float32) for mat in mats]
+                        for _ in range(2)]
+
+    def infer(self, columns, count):
+        tensors = self.model.tensorize_data([column[:count] for column in columns])
+        continuous_preds, pred_labels = self.model.perform_inference(self.model.select_data(tensors))
+        return np.asarray(continuous_preds, dtype=np.float64).reshape(-1)
+
+    @staticmethod
+    def collect(pending):
+        future, keys = pending
+        return np.array(keys), future.result()
+
+    @staticmethod
+    def to_states(records, max_units):
+        """States array and unit counts (see MapUtils.units_to_array) of a list of unit records"""
+        units = np.array(records, dtype=np.int64).reshape(len(records), -1, CompactMap.UNIT_FIELDS)
+        # alive units first, in id order as in to_unit_list
+        alive = units[:, :, CompactMap.F_ALIVE] != 0
+        order = np.argsort(~alive, axis=1, kind='stable')
+        units = np.take_along_axis(units, order[:, :, np.newaxis], axis=1)
+        counts = alive.sum(axis=1)
+        if len(counts) > 0 and counts.max() > max_units:
+            raise ValueError("state has " + str(counts.max()) + " units, more than max_units=" + str(max_units))
+
+        states = np.zeros((len(records), max_units, MapUtils.UNIT_FIELDS), dtype=np.int64)
+        n_units = min(max_units, units.shape[1])
+        states[:, :n_units] = units[:, :n_units, :CompactMap.F_ALIVE]
+        return states, counts
+
+    @staticmethod
+    def to_unit_list(records):
+        # create UnitData objects from the alive units of a snapshot (Spec and UnitData number unit types the same way)
+        unit_list = []
+        for base in range(0, len(records), CompactMap.UNIT_FIELDS):
+            if records[base + CompactMap.F_ALIVE]:
+                unit_list.append(UnitData(*records[base:base + CompactMap.F_ALIVE]))
+        return unit_list
@@ -0,0 +1,89 @@
+import heapq
+from collections import OrderedDict
+
+
+class TTEntry:
+    """Search statistics of one state, shared by every tree node that reaches it"""
+    __slots__ = ("key", "depth", "simnum", "total_score", "sq_score")
+
+    def __init__(self, key, depth):
+        self.key = key
+        self.depth = depth
+        self.simnum = 0
+        self.total_score = 0.0
+        self.sq_score = 0.0
+
+    def mean(self):
+        """Average score of the state (housyuu of MGameTree)"""
+        return self.total_score / self.simnum if self.simnum > 0 else 0.0
+
+
+class TranspositionTable:
+    """
+    Bounded table from state keys (Zobrist keys) to TTEntry statistics.
+
+    Only the statistics are stored, never nodes or boards. A tree node keeps a
+    reference to its entry, so evicting an entry only stops new transpositions from
+    finding it; the nodes that already share it keep updating it.
+
+    When the table is full, entries are evicted by the replacement policy:
+    LRU drops the least recently looked up or updated entry; VISITS drops the
+    EVICT_FRACTION of entries with the fewest visits, the deepest first among equals.
+    """
+    LRU = "lru"
+    VISITS = "visits"
+
+    EVICT_FRACTION = 16  # VISITS evicts 1/EVICT_FRACTION of the table at once, so the scan is amortized
+
+    def __init__(self, capacity, policy=LRU):
+        self.capacity = capacity
+        self.policy = policy
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, key, depth):
+        """Entry of key, created (possibly evicting others) if the table has none"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            if self.policy == TranspositionTable.LRU:
+                self.entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        if len(self.entries) >= self.capacity:
+            self.evict()
+        entry = TTEntry(key, depth)
+        self.entries[key] = entry
+        return entry
+
+    def update(self, entry, score):
+        """Add one visit with score to entry"""
+        entry.simnum += 1
+        entry.total_score += score
+        entry.sq_score += score * score
+        if self.policy == TranspositionTable.LRU and self.entries.get(entry.key) is entry:
+            self.entries.move_to_end(entry.key)
+
+    def evict(self):
+        if self.policy == TranspositionTable.LRU:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+            return
+
+        count = max(len(self.entries) // TranspositionTable.EVICT_FRACTION, 1)
+        for entry in heapq.nsmallest(count, self.entries.values(), key=lambda e: (e.simnum, -e.depth)):
+            del self.entries[entry.key]
+        self.evictions += count
+
+    def clear(self):
+        self.entries.clear()
+
+    def to_string(self):
+        return "size=" + str(len(self.entries)) + "/" + str(self.capacity) + " policy=" + self.policy + \
+               " hits=" + str(self.hits) + " misses=" + str(self.misses) + " evictions=" + str(self.evictions)
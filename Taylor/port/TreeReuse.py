@@ -0,0 +1,46 @@
+class TreeReuse:
+    """
+    Subtree reuse between the make_action calls of one turn.
+    After a search, keep() remembers the child of the returned action and the board that
+    action leads to. If the next make_action is called for the same team on that same
+    position, take() hands the child back as the new root with all its statistics; the
+    siblings are no longer referenced and are freed.
+    """
+
+    def __init__(self):
+        self.node = None   # Child of the returned action
+        self.board = None  # Position after the returned action
+        self.team_color = None
+
+    def keep(self, root, action, map_, team_color):
+        """Remember the child of root that plays action. map_ is the position root was searched from."""
+        node = None
+        for child in root.next:
+            if child.act is action:
+                node = child
+                break
+        if node is None or len(node.next) == 0:
+            self.keep_node(None, None, team_color)
+            return
+
+        board = getattr(node, "board", None)
+        if board is None:  # Trees that keep no boards in their nodes
+            board = map_.create_deep_clone()
+            board.execute_action(action)
+        self.keep_node(node, board, team_color)
+
+    def keep_node(self, node, board, team_color):
+        """Remember an expanded root for board directly, for trees that are not made of MGameTree nodes"""
+        self.node = node
+        self.board = board
+        self.team_color = team_color
+
+    def take(self, map_, team_color):
+        """The kept node if map_ is the position it leads to, else None. Forgets it either way."""
+        node = self.node
+        board = self.board
+        self.node = None
+        self.board = None
+        if node is None or team_color != self.team_color or not board.is_same_state(map_):
+            return None
+        return node
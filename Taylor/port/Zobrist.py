@@ -0,0 +1,62 @@
+import random
+
+from Spec import Spec
+
+
+class Zobrist:
+    """
+    64-bit Zobrist keys for map states.
+    A unit contributes (team, type, cell) ^ (cell, HP) ^ (cell, finished), and the
+    turn count contributes one more key. Unit ids are not part of the key, so two
+    states that only differ by which unit id stands where hash the same, like the
+    old string hash in AI_MCTS_hash.
+
+    The tables are generated from a fixed seed, so keys are identical across
+    processes and can be shared by any agent that keeps a transposition table.
+    """
+    SEED = 20240522
+    MAX_MAP_SIZE = 32   # Maximum map width/height supported by the tables
+    HP_LEVELS = 16      # HP values 0..15
+    MAX_TURNS = 256     # Turn counts 0..255
+
+    CELLS = MAX_MAP_SIZE * MAX_MAP_SIZE
+
+    # Key tables, filled below the class definition
+    unit_keys = None      # [(team * SPECTYPENUM + type) * CELLS + cell]
+    hp_keys = None        # [cell * HP_LEVELS + HP]
+    finished_keys = None  # [cell]
+    turn_keys = None      # [turn_count]
+
+    @staticmethod
+    def unit_key(unit):
+        """Key of one unit at its current position, HP and finished flag"""
+        cell = unit.get_x_pos() * Zobrist.MAX_MAP_SIZE + unit.get_y_pos()
+        key = Zobrist.unit_keys[(unit.get_team_color() * Spec.SPECTYPENUM + unit.get_type_of_unit()) * Zobrist.CELLS + cell]
+        key ^= Zobrist.hp_keys[cell * Zobrist.HP_LEVELS + unit.get_HP()]
+        if unit.is_action_finished():
+            key ^= Zobrist.finished_keys[cell]
+        return key
+
+    @staticmethod
+    def turn_key(turn_count):
+        """Key of the turn counter (0 while the turn count is unset)"""
+        if turn_count is None:
+            return 0
+        return Zobrist.turn_keys[turn_count % Zobrist.MAX_TURNS]
+
+    @staticmethod
+    def compute_key(map_):
+        """Compute the key of a map from scratch"""
+        key = Zobrist.turn_key(map_.get_turn_count())
+        for unit in map_.get_units():
+            if unit is not None:
+                key ^= Zobrist.unit_key(unit)
+        return key
+
+
+# Generate the key tables
+_rand = random.Random(Zobrist.SEED)
+Zobrist.unit_keys = [_rand.getrandbits(64) for _ in range(2 * Spec.SPECTYPENUM * Zobrist.CELLS)]
+Zobrist.hp_keys = [_rand.getrandbits(64) for _ in range(Zobrist.CELLS * Zobrist.HP_LEVELS)]
+Zobrist.finished_keys = [_rand.getrandbits(64) for _ in range(Zobrist.CELLS)]
+Zobrist.turn_keys = [_rand.getrandbits(64) for _ in range(Zobrist.MAX_TURNS)]